@@ -1,6 +1,24 @@
 import os
+import sys
 import datetime
 import re
+import json
+import errno
+import time
+import argparse
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Потоков переименования: на сетевых дисках каждая операция ждёт ответа
+# сервера, поэтому потоков намного больше, чем ядер
+RENAME_WORKERS = 32
+
+# Сколько строк лога копить перед записью в файл
+LOG_BUFFER_LINES = 1000
+
+# Сколько ошибок показать в итоге (все ошибки — в файле лога)
+SUMMARY_MAX_ERRORS = 20
 
 
 def clean_path(p):
@@ -38,85 +56,696 @@ def get_date():
             print("Нужно ввести 1 или 2")
 
 
-def variant_1(root, date_prefix):
-    # Папка с подпапками -> файлы внутри подпапок
-    root = clean_path(root)
-    
-    if not os.path.isdir(root):
-        print(f"Ошибка: '{root}' — не папка или не найдена")
-        return
+# ====================================================================
+#                  План переименования (os.scandir)
+# ====================================================================
+# Сначала составляется весь список (старый_путь, новый_путь), затем он
+# выполняется пулом потоков. Тип записи (файл/папка) берётся из os.scandir
+# без отдельного stat на каждый файл — на сетевых дисках это главная экономия.
+# Прочитанные при этом имена можно сохранить в словарь listings, чтобы
+# проверка конфликтов (find_conflicts) не читала те же папки повторно.
 
-    cnt = 0
-    print(f"\nОбработка папки: {root}")
-    
-    for sub in os.listdir(root):
-        sub_path = os.path.join(root, sub)
-        if not os.path.isdir(sub_path):
+def folder_key(folder):
+    """Ключ папки в словаре listings"""
+    return os.path.normcase(os.path.abspath(folder))
+
+
+def iter_file_names(folder, listings=None):
+    """
+    Имена файлов папки (без подпапок)
+    Если передан словарь listings, в него записываются все имена папки
+    """
+    names = set()
+    with os.scandir(folder) as it:
+        for entry in it:
+            names.add(os.path.normcase(entry.name))
+            if entry.is_file():
+                yield entry.name
+    if listings is not None:
+        listings[folder_key(folder)] = names
+
+
+def walk_folders(root, max_depth=1, errors=None, listings=None):
+    """
+    Итеративный обход подпапок root (без рекурсии, один os.scandir на папку)
+    max_depth — сколько уровней вложенности обходить (None — без ограничения)
+    Ссылки на папки учитываются только среди подпапок самого root (как раньше);
+    глубже они не обходятся, чтобы не выйти за пределы дерева.
+    Недоступные папки пропускаются; если передан список errors,
+    в него добавляются (путь_папки, текст_ошибки); в словарь listings,
+    если он передан, — все имена каждой выданной папки (см. find_conflicts)
+    Генератор: (путь_папки, [имена папок от root], [имена файлов]) для папок
+    на глубине от 1 до max_depth; файлы самого root не выдаются
+    """
+    stack = [(root, [])]
+
+    while stack:
+        folder, parts = stack.pop()
+        subs = []
+        files = []
+        names = set()
+
+        try:
+            with os.scandir(folder) as it:
+                for entry in it:
+                    names.add(os.path.normcase(entry.name))
+                    try:
+                        if entry.is_dir(follow_symlinks=not parts):
+                            subs.append((entry.path, parts + [entry.name]))
+                        elif entry.is_file():
+                            files.append(entry.name)
+                    except OSError:
+                        continue
+        except OSError as e:
+            if errors is not None:
+                errors.append((folder, str(e)))
             continue
-            
-        for fname in os.listdir(sub_path):
-            fpath = os.path.join(sub_path, fname)
-            if not os.path.isfile(fpath):
-                continue
-                
-            name, ext = os.path.splitext(fname)
+
+        if parts:
+            if listings is not None:
+                listings[folder_key(folder)] = names
+            yield folder, parts, files
+
+        if max_depth is None or len(parts) < max_depth:
+            stack.extend(reversed(subs))
+
+
+def plan_variant_1(root, date_prefix, max_depth=1, errors=None, listings=None):
+    """
+    Game: файлы в подпапках root получают префикс даты и суффикс из пути папки
+    (root/A/B/файл.txt -> дата_файл_A_B.txt). max_depth — глубина вложенности,
+    1 — только непосредственные подпапки, None — все уровни.
+    Недоступные папки добавляются в errors, имена папок — в listings (см. walk_folders)
+    Возвращает: список [(старый_путь, новый_путь), ...]
+    """
+    plan = []
+    for folder, parts, files in walk_folders(root, max_depth, errors, listings):
+        suffix = "_".join(parts)
+        for fname in files:
             # Проверка, чтобы не добавлять префикс повторно (опционально)
             if fname.startswith(date_prefix):
                 continue
-                
-            new_name = f"{date_prefix}_{name}_{sub}{ext}"
-            new_path = os.path.join(sub_path, new_name)
-            
+
+            name, ext = os.path.splitext(fname)
+            plan.append((os.path.join(folder, fname),
+                         os.path.join(folder, f"{date_prefix}_{name}_{suffix}{ext}")))
+    return plan
+
+
+def plan_variant_2(target, date_prefix, listings=None):
+    """
+    Префикс даты для одного файла или для всех файлов папки
+    Имена прочитанной папки записываются в listings (см. iter_file_names)
+    Возвращает: список [(старый_путь, новый_путь), ...]
+    """
+    if os.path.isfile(target):
+        folder = os.path.dirname(target) or "."
+        fname = os.path.basename(target)
+        return [(target, os.path.join(folder, f"{date_prefix}_{fname}"))]
+
+    return [(os.path.join(target, fname), os.path.join(target, f"{date_prefix}_{fname}"))
+            for fname in iter_file_names(target, listings)]
+
+
+# ====================================================================
+#          Проверка плана: совпадения новых имён (без выполнения)
+# ====================================================================
+def find_conflicts(plan, listings=None):
+    """
+    Ищет переименования, которые нельзя выполнить безопасно:
+    новое имя уже занято в папке или его получают сразу несколько файлов.
+    Имена папок берутся из listings, собранного при составлении плана;
+    недостающие папки читаются один раз (os.scandir), проверка
+    каждого имени — по множеству, без обращения к диску на каждый файл.
+    Возвращает: (план_без_конфликтов, [(старый_путь, новый_путь, причина), ...])
+    """
+    # папка -> множество имён в ней (без учёта регистра на Windows)
+    names_in = listings if listings is not None else {}
+
+    def folder_names(folder):
+        key = folder_key(folder)
+        names = names_in.get(key)
+        if names is None:
             try:
-                os.rename(fpath, new_path)
-                print(f"{fname} -> {new_name}")
-                cnt += 1
-            except Exception as e:
-                print(f"Ошибка переименования {fname}: {e}")
+                with os.scandir(folder) as it:
+                    names = {os.path.normcase(entry.name) for entry in it}
+            except OSError:
+                names = set()
+            names_in[key] = names
+        return names
+
+    targets = set()
+    good = []
+    conflicts = []
+
+    for old_path, new_path in plan:
+        folder, new_name = os.path.split(os.path.abspath(new_path))
+        key = os.path.normcase(os.path.join(folder, new_name))
+
+        if key in targets:
+            conflicts.append((old_path, new_path, "это имя получает другой файл"))
+        elif key != os.path.normcase(os.path.abspath(old_path)) and os.path.normcase(new_name) in folder_names(folder):
+            conflicts.append((old_path, new_path, "файл с таким именем уже есть"))
+        else:
+            targets.add(key)
+            good.append((old_path, new_path))
+
+    return good, conflicts
+
+
+def print_conflicts(conflicts, limit=SUMMARY_MAX_ERRORS):
+    if not conflicts:
+        return
+    print(f"Пропущено из-за совпадения имён: {len(conflicts)}")
+    for old_path, new_path, reason in conflicts[:limit]:
+        print(f"  {os.path.basename(old_path)} -> {os.path.basename(new_path)}: {reason}")
+    if len(conflicts) > limit:
+        print(f"  ... и ещё {len(conflicts) - limit}")
+
+
+def print_plan(plan, limit=SUMMARY_MAX_ERRORS):
+    """Пробный запуск: показывает начало плана, ничего не переименовывая"""
+    print(f"Будет переименовано: {len(plan)}")
+    for old_path, new_path in plan[:limit]:
+        print(f"  {os.path.basename(old_path)} -> {os.path.basename(new_path)}")
+    if len(plan) > limit:
+        print(f"  ... и ещё {len(plan) - limit}")
+
+
+# ====================================================================
+#               Выполнение плана пулом потоков
+# ====================================================================
+class RenameLog:
+    """
+    Итоги переименования и необязательный лог по файлам.
+    Строки лога копятся в памяти и пишутся в файл пачками,
+    в консоль по каждому файлу ничего не выводится
+    """
+
+    def __init__(self, path=None, buffer_lines=LOG_BUFFER_LINES):
+        self.path = path
+        self.buffer_lines = buffer_lines
+        self.renamed = 0
+        self.already = 0      # уже были в нужном состоянии (повтор по журналу)
+        self.errors = []      # [(старый_путь, текст_ошибки), ...]
+        self.conflicts = []   # [(старый_путь, новый_путь, причина), ...]
+        self._lines = []
+        self._file = open(path, "w", encoding="utf-8") if path else None
+
+    def ok(self, old_path, new_path):
+        self.renamed += 1
+        self._add(f"OK\t{old_path}\t{new_path}")
+
+    def skip(self, old_path, new_path):
+        self.already += 1
+        self._add(f"ALREADY\t{old_path}\t{new_path}")
+
+    def error(self, old_path, new_path, error):
+        self.errors.append((old_path, str(error)))
+        self._add(f"ERROR\t{old_path}\t{new_path}\t{error}")
+
+    def _add(self, line):
+        if self._file is None:
+            return
+        self._lines.append(line)
+        if len(self._lines) >= self.buffer_lines:
+            self.flush()
+
+    def flush(self):
+        if self._file is not None and self._lines:
+            self._file.write("\n".join(self._lines) + "\n")
+            self._lines = []
+
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# Результат _rename: переименование уже было сделано раньше
+ALREADY_DONE = "already"
+
+
+def rename_no_replace(src, dst):
+    """
+    Переименование, которое никогда не заменяет существующий файл:
+    если dst уже есть, выбрасывается FileExistsError.
+    Windows сама не заменяет файл при os.rename; на POSIX rename заменяет
+    молча, поэтому там делается жёсткая ссылка (атомарно падает на занятом
+    имени) и удаление старого имени. Где жёстких ссылок нет — проверка перед rename.
+    Это две операции с метаданными вместо одной: на сетевых дисках
+    переименование медленнее, зато занятое имя никогда не затирается
+    """
+    if os.name == "nt":
+        os.rename(src, dst)
+        return
+
+    try:
+        os.link(src, dst, follow_symlinks=False)
+    except (FileExistsError, FileNotFoundError):
+        raise
+    except OSError:
+        if os.path.lexists(dst):
+            raise FileExistsError(errno.EEXIST, "файл с таким именем уже есть", dst)
+        os.rename(src, dst)
+        return
+
+    os.unlink(src)
+
+
+def _same_file(src, dst):
+    """Два имени одного файла (жёсткие ссылки); ссылки-symlink не разыменовываются"""
+    src_stat = os.lstat(src)
+    dst_stat = os.lstat(dst)
+    return (src_stat.st_ino, src_stat.st_dev) == (dst_stat.st_ino, dst_stat.st_dev)
+
+
+def _rename(pair):
+    """
+    Переименование в потоке пула; возвращает исключение вместо выброса.
+    Занятое целевое имя — ошибка, файл не заменяется (имя могло появиться
+    между планированием и повтором по журналу).
+    Если исходного файла нет, а целевой есть, шаг уже был выполнен
+    (повтор после сбоя) — возвращается ALREADY_DONE. Так же считается шаг,
+    прерванный между os.link и os.unlink: оба имени указывают на один файл,
+    и остаётся удалить старое имя
+    """
+    src, dst = pair
+    try:
+        rename_no_replace(src, dst)
+        return None
+    except FileExistsError:
+        try:
+            if _same_file(src, dst):
+                os.unlink(src)
+                return ALREADY_DONE
+        except OSError as e:
+            return e
+        return FileExistsError(errno.EEXIST, "файл с таким именем уже есть", dst)
+    except FileNotFoundError as e:
+        if os.path.lexists(dst) and not os.path.lexists(src):
+            return ALREADY_DONE
+        return e
+    except Exception as e:
+        return e
+
+
+def execute_renames(plan, workers=RENAME_WORKERS, log_path=None, on_done=None):
+    """
+    Выполняет план переименования в пуле из workers потоков.
+    План подаётся пачками, чтобы на 200k файлов не создавать 200k задач сразу.
+    on_done(номер_в_плане) вызывается после каждого выполненного шага
+    (по порядку, из вызывающего потока).
+    Возвращает: RenameLog с итогами (файл лога уже закрыт)
+    """
+    log = RenameLog(log_path)
+    batch_size = max(workers, 1) * 64
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            for start in range(0, len(plan), batch_size):
+                batch = plan[start:start + batch_size]
+                for pos, ((old_path, new_path), error) in enumerate(zip(batch, executor.map(_rename, batch)), start):
+                    if error is None:
+                        log.ok(old_path, new_path)
+                    elif error == ALREADY_DONE:
+                        log.skip(old_path, new_path)
+                    else:
+                        log.error(old_path, new_path, error)
+                        continue
+                    if on_done:
+                        on_done(pos)
+    finally:
+        log.close()
+
+    return log
+
+
+def print_summary(log, elapsed):
+    """Итог выполнения: число переименований, ошибки и где лежит лог"""
+    print(f"\nВсего переименовано: {log.renamed} за {elapsed:.1f} с")
+
+    if log.already:
+        print(f"Уже были переименованы раньше: {log.already}")
+
+    if log.errors:
+        print(f"Ошибок: {len(log.errors)}")
+        for old_path, error in log.errors[:SUMMARY_MAX_ERRORS]:
+            print(f"  {os.path.basename(old_path)}: {error}")
+        if len(log.errors) > SUMMARY_MAX_ERRORS:
+            print(f"  ... и ещё {len(log.errors) - SUMMARY_MAX_ERRORS}")
+
+    if log.path:
+        print(f"Лог по файлам: {log.path}")
+
+
+# ====================================================================
+#          Журнал переименования: продолжение и откат после сбоя
+# ====================================================================
+# Журнал (NDJSON) — заголовок, затем план: одна строка {"i", "old", "new"}
+# на файл. План пишется во временный файл и атомарно подменяет журнал
+# (os.replace) до первого переименования. Во время выполнения в конец
+# дописываются отметки {"done": i} (при откате — {"undone": i}).
+# Отметки сбрасываются на диск пачками: шаг, выполненный, но не отмеченный
+# до сбоя, при повторе распознаётся по диску (старого имени нет, новое есть).
 
-    print(f"\nВсего переименовано: {cnt}")
+JOURNAL_VERSION = 1
 
+# Через сколько отметок журнал сбрасывается на диск (fsync)
+JOURNAL_FSYNC_EVERY = 1000
 
-def variant_2(target, date_prefix):
+
+def write_journal(path, plan):
+    """Атомарно записывает план в журнал (пути — абсолютные)"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        header = {"journal": JOURNAL_VERSION, "created": time.strftime("%Y-%m-%d %H:%M:%S"), "count": len(plan)}
+        f.write(json.dumps(header, ensure_ascii=False) + "\n")
+        for idx, (old_path, new_path) in enumerate(plan):
+            record = {"i": idx, "old": os.path.abspath(old_path), "new": os.path.abspath(new_path)}
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_journal(path):
+    """
+    Читает журнал. Оборванная при сбое последняя строка пропускается
+    Возвращает: (план, {номер: 'done' или 'undone'})
+    """
+    plan = []
+    state = {}
+
+    with open(path, encoding="utf-8") as f:
+        header = None
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+
+            if header is None:
+                if record.get("journal") != JOURNAL_VERSION:
+                    raise ValueError(f"'{path}' — не журнал переименования")
+                header = record
+            elif "old" in record:
+                plan.append((record["old"], record["new"]))
+            elif "done" in record:
+                state[record["done"]] = "done"
+            elif "undone" in record:
+                state[record["undone"]] = "undone"
+
+    if header is None:
+        raise ValueError(f"'{path}' — пустой журнал")
+    return plan, state
+
+
+class JournalMarks:
+    """Дописывает отметки выполнения в конец журнала"""
+
+    def __init__(self, path, fsync_every=JOURNAL_FSYNC_EVERY):
+        self.fsync_every = fsync_every
+        self._pending = 0
+
+        # После сбоя последняя строка может быть оборвана: начинаем с новой
+        torn = False
+        with open(path, "rb") as f:
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+
+        self._file = open(path, "a", encoding="utf-8")
+        if torn:
+            self._file.write("\n")
+
+    def mark(self, key, idx):
+        self._file.write(f'{{"{key}": {idx}}}\n')
+        self._pending += 1
+        if self._pending >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+
+def _run_marked(steps, mark_key, journal_path, workers, log_path):
+    """Выполняет шаги [(номер, (откуда, куда)), ...] с отметками в журнале"""
+    marks = JournalMarks(journal_path)
+    try:
+        return execute_renames([pair for _, pair in steps], workers, log_path,
+                               on_done=lambda pos: marks.mark(mark_key, steps[pos][0]))
+    finally:
+        marks.close()
+
+
+def resume_journal(journal_path, workers=RENAME_WORKERS, log_path=None):
+    """
+    Выполняет (или продолжает) переименование по журналу без повторного
+    обхода папок: выполняются только шаги без отметки done
+    Возвращает: RenameLog
+    """
+    plan, state = read_journal(journal_path)
+    steps = [(idx, pair) for idx, pair in enumerate(plan) if state.get(idx) != "done"]
+    print(f"По журналу: {len(plan)}, уже выполнено: {len(plan) - len(steps)}, осталось: {len(steps)}")
+    return _run_marked(steps, "done", journal_path, workers, log_path)
+
+
+def rollback_journal(journal_path, workers=RENAME_WORKERS, log_path=None):
+    """
+    Возвращает прежние имена по журналу. Откатываются все шаги, кроме уже
+    откаченных: шаги, до которых выполнение не дошло, распознаются по диску
+    Возвращает: RenameLog
+    """
+    plan, state = read_journal(journal_path)
+    steps = [(idx, (new_path, old_path)) for idx, (old_path, new_path) in reversed(list(enumerate(plan)))
+             if state.get(idx) != "undone"]
+    print(f"Откат по журналу: {len(steps)} шагов")
+    return _run_marked(steps, "undone", journal_path, workers, log_path)
+
+
+def run_journal_action(action, journal_path, workers=RENAME_WORKERS, log_path=None):
+    """Продолжение (resume_journal) или откат (rollback_journal) с итогом"""
+    start = time.perf_counter()
+    log = action(clean_path(journal_path), workers, log_path)
+    print_summary(log, time.perf_counter() - start)
+    return log
+
+
+# ====================================================================
+#                        Варианты переименования
+# ====================================================================
+def run_plan(plan, workers=RENAME_WORKERS, log_path=None, dry_run=False, journal_path=None, listings=None):
+    """
+    Проверяет план на совпадения имён и выполняет его (dry_run — только показывает).
+    listings — имена папок, прочитанные при составлении плана (см. find_conflicts).
+    С journal_path план сначала пишется в журнал, и выполнение идёт по нему;
+    при пробном запуске журнал тоже пишется, чтобы выполнить его позже без обхода
+    Возвращает: RenameLog (при dry_run — пустой, с найденными конфликтами)
+    """
+    plan, conflicts = find_conflicts(plan, listings)
+    print_conflicts(conflicts)
+
+    if journal_path:
+        write_journal(journal_path, plan)
+        print(f"Журнал: {journal_path}")
+
+    if dry_run:
+        print_plan(plan)
+        log = RenameLog()
+    else:
+        print(f"Файлов к переименованию: {len(plan)}")
+        start = time.perf_counter()
+        if journal_path:
+            log = _run_marked(list(enumerate(plan)), "done", journal_path, workers, log_path)
+        else:
+            log = execute_renames(plan, workers, log_path)
+        print_summary(log, time.perf_counter() - start)
+
+    log.conflicts = conflicts
+    return log
+
+
+def variant_1(root, date_prefix, workers=RENAME_WORKERS, log_path=None, dry_run=False, journal_path=None,
+              max_depth=1):
+    # Папка с подпапками -> файлы внутри подпапок (max_depth уровней, None — все)
+    root = clean_path(root)
+    
+    if not os.path.isdir(root):
+        print(f"Ошибка: '{root}' — не папка или не найдена")
+        return None
+
+    print(f"\nОбработка папки: {root}")
+    errors = []
+    listings = {}
+    plan = plan_variant_1(root, date_prefix, max_depth, errors, listings)
+    for folder, error in errors:
+        print(f"Папка пропущена: {folder}: {error}")
+
+    log = run_plan(plan, workers, log_path, dry_run, journal_path, listings)
+    log.errors.extend(errors)
+    return log
+
+
+def variant_2(target, date_prefix, workers=RENAME_WORKERS, log_path=None, dry_run=False, journal_path=None):
     # Файл или папка -> добавить префикс
     target = clean_path(target)
 
     if os.path.isfile(target):
         # Единичный файл
-        folder = os.path.dirname(target) or "."
-        fname = os.path.basename(target)
-        new_name = f"{date_prefix}_{fname}"
-        new_path = os.path.join(folder, new_name)
-        
-        try:
-            os.rename(target, new_path)
-            print(f"\n{fname} -> {new_name}")
-            print("Готово (1 файл)")
-        except Exception as e:
-            print(f"Ошибка: {e}")
-
+        print(f"\nОбработка файла: {target}")
     elif os.path.isdir(target):
         # Папка — переименовать все файлы внутри
         print(f"\nОбработка файлов в папке: {target}")
-        cnt = 0
-        for fname in os.listdir(target):
-            fpath = os.path.join(target, fname)
-            if not os.path.isfile(fpath):
-                continue
-                
-            new_name = f"{date_prefix}_{fname}"
-            new_path = os.path.join(target, new_name)
-            
-            try:
-                os.rename(fpath, new_path)
-                print(f"{fname} -> {new_name}")
-                cnt += 1
-            except Exception as e:
-                print(f"Ошибка переименования {fname}: {e}")
-        print(f"\nВсего переименовано: {cnt}")
-        
     else:
         print(f"Ошибка: путь '{target}' не найден")
+        return None
+
+    listings = {}
+    plan = plan_variant_2(target, date_prefix, listings)
+    return run_plan(plan, workers, log_path, dry_run, journal_path, listings)
+
+
+def ask_optional_path(prompt):
+    """Путь из ввода или None, если нажат Enter"""
+    return clean_path(input(prompt)) or None
+
+
+def ask_depth():
+    """Глубина вложенности для варианта 1: Enter — 1 уровень, 0 — все уровни"""
+    while True:
+        raw = input("Глубина вложенности (Enter — 1, 0 — все уровни): ").strip()
+        if not raw:
+            return 1
+        if raw.isdigit():
+            return int(raw) or None
+        print("Нужно ввести число")
+
+
+# ====================================================================
+#               Запуск из командной строки (без вопросов)
+# ====================================================================
+# Примеры:
+#     python presufixator.py game D:\Games -r --date 20251122
+#     python presufixator.py date D:\in\a D:\in\b --dry-run --journal plan.ndjson
+#     python presufixator.py resume plan.ndjson -q
+# Все цели объединяются в один план: одна проверка совпадений, один журнал
+# и один пул потоков на весь запуск.
+
+EXIT_OK = 0
+EXIT_ERRORS = 1
+EXIT_USAGE = 2
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Пакетное переименование файлов: префикс даты и суффикс папки")
+    parser.add_argument("mode", choices=["game", "date", "resume", "rollback"],
+                        help="game — файлы в подпапках + суффикс папки, date — префикс даты "
+                             "(файл или папка), resume/rollback — продолжить или откатить по журналу")
+    parser.add_argument("targets", nargs="+",
+                        help="папки или файлы (для resume/rollback — журнал)")
+    parser.add_argument("-d", "--date", default="today",
+                        help="дата префикса, например 20251122 (по умолчанию сегодня)")
+    parser.add_argument("-r", "--recursive", action="store_true",
+                        help="game: обходить все уровни вложенности")
+    parser.add_argument("--depth", type=int, default=None,
+                        help="game: глубина вложенности (по умолчанию 1, с -r — без ограничения)")
+    parser.add_argument("-n", "--dry-run", action="store_true",
+                        help="только показать план и совпадения имён")
+    parser.add_argument("-j", "--workers", type=int, default=RENAME_WORKERS,
+                        help=f"потоков переименования (по умолчанию {RENAME_WORKERS})")
+    parser.add_argument("--journal", help="журнал для продолжения и отката (пишется до переименования)")
+    parser.add_argument("--log", help="лог по каждому файлу")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="выводить только ошибки (в stderr)")
+    return parser
+
+
+def plan_targets(mode, targets, date_prefix, max_depth, listings=None):
+    """
+    Общий план по всем целям; имена прочитанных папок записываются в listings
+    Возвращает: (план, [сообщения об ошибочных целях])
+    """
+    plan = []
+    bad = []
+
+    for target in map(clean_path, targets):
+        if mode == "game" and os.path.isdir(target):
+            errors = []
+            plan.extend(plan_variant_1(target, date_prefix, max_depth, errors, listings))
+            bad.extend(f"папка '{folder}' пропущена: {error}" for folder, error in errors)
+        elif mode == "date" and (os.path.isfile(target) or os.path.isdir(target)):
+            plan.extend(plan_variant_2(target, date_prefix, listings))
+        else:
+            bad.append(f"'{target}' — не найден или не {'папка' if mode == 'game' else 'файл или папка'}")
+
+    return plan, bad
+
+
+def cli_main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.workers < 1 or (args.depth is not None and args.depth < 1):
+        print("Ошибка: --workers и --depth должны быть больше нуля", file=sys.stderr)
+        return EXIT_USAGE
+    if args.mode != "game" and (args.recursive or args.depth):
+        print("Ошибка: --recursive и --depth работают только в режиме game", file=sys.stderr)
+        return EXIT_USAGE
+    if args.mode in ["resume", "rollback"] and (args.dry_run or args.journal):
+        # Журнал уже задан целью, а пробного выполнения по журналу нет
+        print("Ошибка: --dry-run и --journal не работают в режимах resume и rollback", file=sys.stderr)
+        return EXIT_USAGE
+
+    try:
+        date_prefix = datetime.date.today().strftime("%Y.%m.%d") if args.date == "today" else parse_date(args.date)
+    except ValueError as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    max_depth = args.depth or (None if args.recursive else 1)
+    stdout = open(os.devnull, "w", encoding="utf-8") if args.quiet else sys.stdout
+    bad = []
+
+    try:
+        with contextlib.redirect_stdout(stdout):
+            if args.mode in ["resume", "rollback"]:
+                if len(args.targets) != 1:
+                    print("Ошибка: для resume/rollback нужен один журнал", file=sys.stderr)
+                    return EXIT_USAGE
+                action = resume_journal if args.mode == "resume" else rollback_journal
+                log = run_journal_action(action, args.targets[0], args.workers, args.log)
+            else:
+                listings = {}
+                plan, bad = plan_targets(args.mode, args.targets, date_prefix, max_depth, listings)
+                print(f"Дата: {date_prefix}, целей: {len(args.targets)}")
+                log = run_plan(plan, args.workers, args.log, args.dry_run, args.journal, listings)
+    except (OSError, ValueError) as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return EXIT_ERRORS
+    finally:
+        if args.quiet:
+            stdout.close()
+
+    for message in bad:
+        print(f"Ошибка: {message}", file=sys.stderr)
+    if args.quiet:
+        for old_path, error in log.errors:
+            print(f"Ошибка переименования {old_path}: {error}", file=sys.stderr)
+        for old_path, new_path, reason in log.conflicts:
+            print(f"Пропущено {old_path}: {reason}", file=sys.stderr)
+
+    return EXIT_ERRORS if bad or log.errors or log.conflicts else EXIT_OK
 
 
 def main():
@@ -124,6 +753,8 @@ def main():
         print("\n=== ПЕРЕИМЕНОВАНИЕ ФАЙЛОВ ===")
         print("1 - Game (подпапки + суффикс папки)")
         print("2 - Добавить дату (файл или папка)")
+        print("3 - Продолжить по журналу")
+        print("4 - Откатить по журналу")
         print("q - Выход")
         
         mode = input("Ваш выбор: ").strip().lower()
@@ -131,20 +762,34 @@ def main():
         if mode == 'q':
             break
             
-        if mode not in ['1', '2']:
+        if mode not in ['1', '2', '3', '4']:
             print("Неверный выбор")
             continue
 
         try:
-            date_prefix = get_date()
-            print(f"Выбрана дата: {date_prefix}")
-            
-            if mode == "1":
-                root = input("Путь к общей папке: ")
-                variant_1(root, date_prefix)
-            elif mode == "2":
-                target = input("Путь к файлу или папке: ")
-                variant_2(target, date_prefix)
+            if mode in ["3", "4"]:
+                journal_path = input("Путь к журналу: ")
+                log_path = ask_optional_path("Файл лога по файлам (Enter — без лога): ")
+                action = resume_journal if mode == "3" else rollback_journal
+                run_journal_action(action, journal_path, log_path=log_path)
+
+            else:
+                date_prefix = get_date()
+                print(f"Выбрана дата: {date_prefix}")
+
+                options = {}
+                if mode == "1":
+                    target = input("Путь к общей папке: ")
+                    options["max_depth"] = ask_depth()
+                else:
+                    target = input("Путь к файлу или папке: ")
+
+                dry_run = input("Только проверить, ничего не переименовывая? (y/N): ").strip().lower() in ["y", "д"]
+                journal_path = ask_optional_path("Файл журнала для продолжения/отката (Enter — без журнала): ")
+                log_path = None if dry_run else ask_optional_path("Файл лога по файлам (Enter — без лога): ")
+
+                variant = variant_1 if mode == "1" else variant_2
+                variant(target, date_prefix, log_path=log_path, dry_run=dry_run, journal_path=journal_path, **options)
                 
         except Exception as e:
             print(f"Произошла ошибка: {e}")
@@ -153,6 +798,10 @@ def main():
 
 
 if __name__ == "__main__":
+    # С аргументами — пакетный режим без вопросов (cron, планировщик)
+    if len(sys.argv) > 1:
+        sys.exit(cli_main())
+
     try:
         main()
     except KeyboardInterrupt:
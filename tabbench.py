@@ -0,0 +1,488 @@
+"""
+Замеры скорости чтения Excel на синтетических файлах (без GUI).
+
+Генерирует наборы XLSX/XLS с заданными параметрами (число вкладок, ширина,
+завышенный <dimension>, смещение строки заголовков, размер таблицы общих
+строк, число файлов) и замеряет функции tabcore: время, пиковую память
+процесса (RSS) и файлов в секунду. Результат — JSON, который можно
+сравнить с замером предыдущей версии.
+
+Каждый замер идёт в новом процессе (spawn, без унаследованной памяти родителя).
+peak_rss_mb — пик всего процесса, вместе с интерпретатором и импортами;
+rss_before_mb — пик до начала замера (для group_sheets_by_mapping в него
+входит анализ структуры, время которого не замеряется).
+
+Примеры:
+    python tabbench.py -o bench.json
+    python tabbench.py --only wide,big_sst --scale 0.2
+    python tabbench.py -o new.json --compare old.json
+
+Коды выхода: 0 — готово, 1 — найдены незакрытые файлы или (при --compare)
+замедления, 2 — неверные аргументы.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import zipfile
+import argparse
+import platform
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from xml.sax.saxutils import escape
+
+from tabcore import (
+    count_sheets_in_file,
+    get_sheet_names,
+    find_header_row,
+    find_header_row_xls,
+    analyze_file_structure,
+    group_sheets_by_mapping,
+    get_column_letter,
+    open_read_only_workbook,
+    open_xls_book,
+    open_handle_count,
+)
+
+try:
+    import resource  # нет на Windows
+except ImportError:
+    resource = None
+
+try:
+    import psutil  # необязательно: пиковая память на Windows
+except ImportError:
+    psutil = None
+
+BENCH_FORMAT_VERSION = 1
+BENCH_SEED = 20240601
+
+# Замедление больше этой доли относительно прошлого замера считается регрессией
+REGRESSION_TOLERANCE = 0.25
+# Замеры короче этого (в секундах) не сравниваются: в них больше шума, чем сигнала
+REGRESSION_MIN_SECONDS = 0.05
+
+# Сценарии: каждый меняет одну-две величины относительно обычного файла
+DEFAULT_SPEC = {
+    "format": "xlsx",
+    "files": 20,
+    "sheets": 5,
+    "cols": 12,
+    "rows": 200,
+    "header_offset": 1,
+    "bogus_dimension": False,
+    "shared_strings": 0,
+    "mappings": 3,
+}
+
+SCENARIOS = {
+    "baseline": {},
+    "many_sheets": {"sheets": 60, "rows": 30},
+    "wide": {"files": 10, "cols": 250},
+    "bogus_dimension": {"bogus_dimension": True},
+    "header_offset": {"header_offset": 40},
+    "big_sst": {"files": 5, "sheets": 2, "shared_strings": 200000},
+    "many_files": {"files": 500, "sheets": 1, "rows": 20},
+    "xls": {"format": "xls"},
+    "xls_many_sheets": {"format": "xls", "sheets": 60, "rows": 30},
+}
+
+TARGETS = [
+    "count_sheets_in_file",
+    "get_sheet_names",
+    "find_header_row",
+    "analyze_file_structure",
+    "group_sheets_by_mapping",
+]
+
+
+# ====================================================================
+#                  Генерация синтетических файлов
+# ====================================================================
+XLSX_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+# Ширина и высота листа в «раздутом» <dimension> (вся сетка Excel)
+BOGUS_DIMENSION_REF = "A1:XFD1048576"
+
+
+def make_header_layouts(spec, rng):
+    """Несколько разных наборов заголовков, чтобы группировка маппинга не была тривиальной"""
+    layouts = []
+    for layout_num in range(max(spec["mappings"], 1)):
+        names = [f"Столбец {col}" for col in range(1, spec["cols"] + 1)]
+        # Каждый следующий маппинг отличается несколькими переименованными столбцами
+        for col in rng.sample(range(spec["cols"]), min(layout_num, spec["cols"])):
+            names[col] = f"Поле {layout_num}.{col}"
+        layouts.append(names)
+    return layouts
+
+
+def iter_sheet_rows(spec, headers, rng):
+    """
+    Строки листа: заголовок в строке header_offset (выше пусто), затем данные
+    Генератор: (номер_строки, [значения]); строка — общая строка, число — число
+    """
+    header_row = spec["header_offset"]
+    yield header_row, headers
+
+    for row_num in range(header_row + 1, header_row + spec["rows"] + 1):
+        yield row_num, [rng.randint(0, 10 ** 6) if col % 2 else f"знач {rng.randint(0, 999)}"
+                        for col in range(len(headers))]
+
+
+class _SharedStrings:
+    """Таблица общих строк XLSX, набирается при записи листов"""
+
+    def __init__(self):
+        self.index = {}
+
+    def __call__(self, text):
+        if text not in self.index:
+            self.index[text] = len(self.index)
+        return self.index[text]
+
+    def pad_to(self, size):
+        """Добавляет неиспользуемые строки до заданного размера таблицы"""
+        num = 0
+        while len(self.index) < size:
+            self(f"запас {num}")
+            num += 1
+
+    def to_xml(self):
+        items = "".join(f"<si><t>{escape(text)}</t></si>" for text in self.index)
+        return (f'<sst xmlns="{XLSX_NS}" count="{len(self.index)}" uniqueCount="{len(self.index)}">'
+                f'{items}</sst>')
+
+
+def _sheet_xml(spec, headers, rng, shared):
+    rows_xml = []
+    last_row = 0
+    for row_num, values in iter_sheet_rows(spec, headers, rng):
+        cells = []
+        for col, value in enumerate(values, 1):
+            ref = f"{get_column_letter(col)}{row_num}"
+            if isinstance(value, str):
+                cells.append(f'<c r="{ref}" t="s"><v>{shared(value)}</v></c>')
+            else:
+                cells.append(f'<c r="{ref}"><v>{value}</v></c>')
+        rows_xml.append(f'<row r="{row_num}">{"".join(cells)}</row>')
+        last_row = row_num
+
+    if spec["bogus_dimension"]:
+        dimension = BOGUS_DIMENSION_REF
+    else:
+        dimension = f"A1:{get_column_letter(len(headers))}{last_row}"
+
+    return (f'<worksheet xmlns="{XLSX_NS}"><dimension ref="{dimension}"/>'
+            f'<sheetData>{"".join(rows_xml)}</sheetData></worksheet>')
+
+
+def write_synthetic_xlsx(path, spec, rng):
+    """Пишет XLSX напрямую из XML: так можно задать любой <dimension> и размер общих строк"""
+    layouts = make_header_layouts(spec, rng)
+    shared = _SharedStrings()
+    sheet_count = spec["sheets"]
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for sheet_num in range(1, sheet_count + 1):
+            headers = layouts[(sheet_num - 1) % len(layouts)]
+            zf.writestr(f"xl/worksheets/sheet{sheet_num}.xml", _sheet_xml(spec, headers, rng, shared))
+
+        shared.pad_to(spec["shared_strings"])
+        zf.writestr("xl/sharedStrings.xml", shared.to_xml())
+
+        sheets_xml = "".join(f'<sheet name="Лист{num}" sheetId="{num}" r:id="rId{num}"/>'
+                             for num in range(1, sheet_count + 1))
+        zf.writestr("xl/workbook.xml",
+                    f'<workbook xmlns="{XLSX_NS}" xmlns:r="{REL_NS}"><sheets>{sheets_xml}</sheets></workbook>')
+
+        rels = [f'<Relationship Id="rId{num}" Target="worksheets/sheet{num}.xml" '
+                f'Type="{REL_NS}/worksheet"/>' for num in range(1, sheet_count + 1)]
+        rels.append(f'<Relationship Id="rId{sheet_count + 1}" Target="sharedStrings.xml" '
+                    f'Type="{REL_NS}/sharedStrings"/>')
+        zf.writestr("xl/_rels/workbook.xml.rels",
+                    f'<Relationships xmlns="{PKG_REL_NS}">{"".join(rels)}</Relationships>')
+
+        zf.writestr("_rels/.rels",
+                    f'<Relationships xmlns="{PKG_REL_NS}"><Relationship Id="rId1" '
+                    f'Type="{REL_NS}/officeDocument" Target="xl/workbook.xml"/></Relationships>')
+
+        overrides = "".join(
+            f'<Override PartName="/xl/worksheets/sheet{num}.xml" ContentType="application/'
+            f'vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            for num in range(1, sheet_count + 1))
+        zf.writestr("[Content_Types].xml",
+                    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                    '<Default Extension="xml" ContentType="application/xml"/>'
+                    '<Override PartName="/xl/workbook.xml" ContentType="application/'
+                    'vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                    '<Override PartName="/xl/sharedStrings.xml" ContentType="application/'
+                    'vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+                    f'{overrides}</Types>')
+
+
+def write_synthetic_xls(path, spec, rng):
+    """Пишет XLS через xlwt (<dimension> и общие строки в XLS задать нельзя)"""
+    import xlwt  # нужен только для генерации XLS
+
+    wb = xlwt.Workbook(encoding="utf-8")
+    layouts = make_header_layouts(spec, rng)
+
+    for sheet_num in range(1, spec["sheets"] + 1):
+        ws = wb.add_sheet(f"Лист{sheet_num}")
+        headers = layouts[(sheet_num - 1) % len(layouts)]
+        for row_num, values in iter_sheet_rows(spec, headers, rng):
+            for col, value in enumerate(values):
+                ws.write(row_num - 1, col, value)
+
+    wb.save(path)
+
+
+def generate_corpus(folder, name, spec, seed=BENCH_SEED):
+    """
+    Создаёт файлы сценария в папке folder/name
+    Возвращает: список путей
+    """
+    rng = random.Random(f"{seed}:{name}")
+    target = os.path.join(folder, name)
+    os.makedirs(target, exist_ok=True)
+
+    write = write_synthetic_xls if spec["format"] == "xls" else write_synthetic_xlsx
+    paths = []
+    for file_num in range(1, spec["files"] + 1):
+        path = os.path.join(target, f"file_{file_num:05d}.{spec['format']}")
+        write(path, spec, rng)
+        paths.append(path)
+    return paths
+
+
+# ====================================================================
+#                             Замеры
+# ====================================================================
+def peak_rss_mb():
+    """Пиковая память процесса в МБ или None, если узнать нельзя"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux отдаёт килобайты, macOS — байты
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / (1024 * 1024), 1)
+    return None
+
+
+def _find_headers_in_file(path):
+    """find_header_row по всем вкладкам файла (для XLS — find_header_row_xls)"""
+    if path.lower().endswith(".xls"):
+        with open_xls_book(path, ragged_rows=True) as wb:
+            for sheet_idx in range(wb.nsheets):
+                find_header_row_xls(wb.sheet_by_index(sheet_idx))
+                wb.unload_sheet(sheet_idx)
+        return
+
+    with open_read_only_workbook(path) as wb:
+        for ws in wb.worksheets:
+            find_header_row(ws)
+
+
+def run_target(target, paths):
+    """
+    Выполняется в отдельном процессе, чтобы пиковая память относилась к одной функции.
+    Пик до начала замера (импорты, подготовка входных данных) записывается отдельно
+    Возвращает: словарь с временем, памятью и числом незакрытых дескрипторов
+    """
+    if target == "group_sheets_by_mapping":
+        # Структура читается до замера: время — только группировка
+        inputs = [analyze_file_structure(path) for path in paths]
+        func = group_sheets_by_mapping
+    else:
+        inputs = paths
+        func = {
+            "count_sheets_in_file": count_sheets_in_file,
+            "get_sheet_names": get_sheet_names,
+            "find_header_row": _find_headers_in_file,
+            "analyze_file_structure": analyze_file_structure,
+        }[target]
+
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    for item in inputs:
+        func(item)
+    wall = time.perf_counter() - start
+
+    return {
+        "wall_s": round(wall, 6),
+        "files_per_s": round(len(paths) / wall, 1) if wall > 0 else None,
+        "rss_before_mb": rss_before,
+        "peak_rss_mb": peak_rss_mb(),
+        # Не закрытые после замера файлы и книги: больше нуля — утечка
+        "open_handles": open_handle_count(),
+    }
+
+
+def measure(target, paths, repeat=1):
+    """Лучшее время из repeat запусков, каждый в новом процессе"""
+    # spawn, а не fork: иначе в пик памяти попадает всё, что успел занять родитель
+    context = multiprocessing.get_context("spawn")
+    best = None
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            result = executor.submit(run_target, target, paths).result()
+        if best is None or result["wall_s"] < best["wall_s"]:
+            best = result
+    return best
+
+
+def scenario_spec(name, scale=1.0):
+    """Параметры сценария с числом файлов, умноженным на scale (не меньше одного)"""
+    spec = dict(DEFAULT_SPEC, **SCENARIOS[name])
+    spec["files"] = max(1, int(spec["files"] * scale))
+    return spec
+
+
+def run_benchmarks(scenarios, targets, folder, scale=1.0, repeat=1, progress=None):
+    """
+    Генерирует наборы и замеряет функции
+    Возвращает: список записей {scenario, target, files, wall_s, files_per_s, rss_before_mb, peak_rss_mb}
+    """
+    results = []
+
+    for name in scenarios:
+        spec = scenario_spec(name, scale)
+        paths = generate_corpus(folder, name, spec)
+
+        for target in targets:
+            record = {"scenario": name, "target": target, "files": len(paths)}
+            record.update(measure(target, paths, repeat))
+            results.append(record)
+            if progress:
+                progress(record)
+
+    return results
+
+
+def compare_results(current, baseline, tolerance=REGRESSION_TOLERANCE):
+    """
+    Сравнивает замер с прошлым
+    Возвращает: список (сценарий, функция, было_сек, стало_сек) для замедлений больше tolerance
+    """
+    previous = {(r["scenario"], r["target"]): r for r in baseline.get("results", [])}
+    regressions = []
+
+    for record in current["results"]:
+        old = previous.get((record["scenario"], record["target"]))
+        if not old or max(old["wall_s"], record["wall_s"]) < REGRESSION_MIN_SECONDS:
+            continue
+        if record["wall_s"] > old["wall_s"] * (1 + tolerance):
+            regressions.append((record["scenario"], record["target"], old["wall_s"], record["wall_s"]))
+
+    return regressions
+
+
+# ====================================================================
+#                          Точка входа
+# ====================================================================
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Замеры скорости чтения Excel на синтетических файлах")
+    parser.add_argument("-o", "--output", help="файл JSON с результатом (по умолчанию stdout)")
+    parser.add_argument("--only", help="сценарии через запятую: " + ", ".join(SCENARIOS))
+    parser.add_argument("--targets", help="функции через запятую: " + ", ".join(TARGETS))
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="множитель числа файлов в сценариях (по умолчанию 1)")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="запусков на замер, берётся лучшее время")
+    parser.add_argument("--corpus", help="папка для файлов (по умолчанию временная, удаляется)")
+    parser.add_argument("--compare", help="JSON прошлого замера для поиска замедлений")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE,
+                        help="допустимое замедление при --compare (0.25 = 25%%)")
+    return parser
+
+
+def parse_names(text, known, what):
+    if not text:
+        return list(known)
+    names = [name.strip() for name in text.split(",") if name.strip()]
+    unknown = [name for name in names if name not in known]
+    if unknown:
+        raise ValueError(f"неизвестные {what}: {', '.join(unknown)}")
+    return names
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    try:
+        scenarios = parse_names(args.only, SCENARIOS, "сценарии")
+        targets = parse_names(args.targets, TARGETS, "функции")
+        baseline = None
+        if args.compare:
+            with open(args.compare, encoding="utf-8") as f:
+                baseline = json.load(f)
+    except (ValueError, OSError) as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 2
+
+    folder = args.corpus or tempfile.mkdtemp(prefix="tabbench_")
+
+    def progress(record):
+        print(f"{record['scenario']:>16} {record['target']:<24} {record['wall_s']:>9.3f} с "
+              f"{record['files_per_s'] or 0:>9.1f} ф/с  {record['peak_rss_mb'] or '-'} МБ", file=sys.stderr)
+
+    try:
+        results = run_benchmarks(scenarios, targets, folder, args.scale, args.repeat, progress)
+    finally:
+        if not args.corpus:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    report = {
+        "format_version": BENCH_FORMAT_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scale": args.scale,
+        # Параметры, с которыми файлы действительно созданы (с учётом --scale)
+        "scenarios": {name: scenario_spec(name, args.scale) for name in scenarios},
+        "results": results,
+    }
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    failed = False
+    for record in results:
+        if record["open_handles"]:
+            print(f"Утечка: {record['scenario']} / {record['target']}: "
+                  f"не закрыто {record['open_handles']}", file=sys.stderr)
+            failed = True
+
+    if baseline is not None:
+        regressions = compare_results(report, baseline, args.tolerance)
+        for scenario, target, old, new in regressions:
+            print(f"Замедление: {scenario} / {target}: {old:.3f} с -> {new:.3f} с", file=sys.stderr)
+        failed = failed or bool(regressions)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    # Нужен для процессов-замеров в собранном exe (Windows)
+    multiprocessing.freeze_support()
+
+    if sys.platform == "win32":
+        try:
+            sys.stdout.reconfigure(encoding='utf-8')
+        except:
+            pass
+
+    sys.exit(main())
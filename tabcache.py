@@ -0,0 +1,484 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+from tabcore import (
+    read_sheet_list,
+    read_structure_payload,
+    map_files_parallel,
+    group_sheets_by_mapping,
+    HeaderVocabulary,
+    compact_structure,
+    expand_structure,
+)
+
+
+# ====================================================================
+#              Постоянный кэш результатов анализа (SQLite)
+# ====================================================================
+# Одни и те же книги с общего диска открываются каждый день: результат
+# хранится на диске и берётся из кэша, пока файл не изменился.
+# Ключ — путь + отпечаток файла (размер и время изменения или хэш содержимого).
+
+# Лимиты кэша: при превышении удаляются давно не использованные записи
+CACHE_MAX_ENTRIES = 200_000
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Как часто (в записях) проверять лимиты
+CACHE_EVICT_EVERY = 500
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Сколько файлов искать в кэше за один раз при пакетной обработке:
+# отпечатки считаются по мере обработки, а не для всего списка заранее
+CACHE_LOOKUP_BATCH = 500
+
+
+def default_cache_path():
+    """Путь к файлу кэша в пользовательской папке кэша"""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "tabcounter", "analysis_cache.sqlite3")
+
+
+def file_fingerprint(path, use_hash=False):
+    """
+    Отпечаток файла: "размер:mtime_ns" или SHA-1 содержимого (use_hash=True).
+    Хэш надёжнее на дисках с неточным временем изменения, но читает весь файл
+    """
+    if not use_hash:
+        st = os.stat(path)
+        return f"{st.st_size}:{st.st_mtime_ns}"
+
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return "sha1:" + digest.hexdigest()
+
+
+class AnalysisCache:
+    """
+    Кэш результатов по файлам. kind — вид результата:
+    'sheets' (список вкладок), 'structure' (анализ заголовков).
+    Можно использовать из нескольких потоков
+    """
+
+    def __init__(self, db_path=None, use_hash=False,
+                 max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES):
+        self.db_path = db_path or default_cache_path()
+        self.use_hash = use_hash
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._puts = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS analysis (
+                path TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (path, kind)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS analysis_last_used ON analysis (last_used)")
+        self._conn.commit()
+
+        # Короткие сессии (меньше CACHE_EVICT_EVERY записей) до очистки в put
+        # не доходят, поэтому лимиты проверяются и при открытии, и при закрытии
+        with self._lock:
+            self._evict()
+
+    def _key_path(self, path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def get_many(self, paths, kind):
+        """
+        Ищет результаты сразу для многих файлов (одна транзакция).
+        Возвращает: словарь {путь: значение} только для найденных и неизменённых файлов
+        """
+        found = {}
+        now = time.time()
+
+        with self._lock:
+            for path in paths:
+                try:
+                    fingerprint = file_fingerprint(path, self.use_hash)
+                except OSError:
+                    continue
+
+                key = self._key_path(path)
+                row = self._conn.execute(
+                    "SELECT fingerprint, payload FROM analysis WHERE path = ? AND kind = ?",
+                    (key, kind)).fetchone()
+
+                if row and row[0] == fingerprint:
+                    found[path] = json.loads(row[1])
+                    self._conn.execute(
+                        "UPDATE analysis SET last_used = ? WHERE path = ? AND kind = ?",
+                        (now, key, kind))
+
+            self._conn.commit()
+
+        return found
+
+    def get(self, path, kind):
+        """Возвращает сохранённое значение или None, если файла нет в кэше или он изменился"""
+        return self.get_many([path], kind).get(path)
+
+    def put(self, path, kind, value):
+        """Сохраняет результат для текущей версии файла"""
+        try:
+            fingerprint = file_fingerprint(path, self.use_hash)
+        except OSError:
+            return
+
+        payload = json.dumps(value, ensure_ascii=False)
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analysis (path, kind, fingerprint, payload, size, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self._key_path(path), kind, fingerprint, payload, len(payload), time.time()))
+            self._conn.commit()
+
+            self._puts += 1
+            if self._puts % CACHE_EVICT_EVERY == 0:
+                self._evict()
+
+    def _evict(self):
+        """Удаляет давно не использованные записи сверх лимитов (вызывать под блокировкой)"""
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM analysis").fetchone()
+
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM analysis WHERE rowid IN "
+                "(SELECT rowid FROM analysis ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,))
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM analysis").fetchone()[0]
+
+        if total > self.max_bytes:
+            stale = []
+            for rowid, size in self._conn.execute("SELECT rowid, size FROM analysis ORDER BY last_used"):
+                if total <= self.max_bytes:
+                    break
+                stale.append((rowid,))
+                total -= size
+            self._conn.executemany("DELETE FROM analysis WHERE rowid = ?", stale)
+
+        self._conn.commit()
+
+    def clear(self):
+        """Полностью очищает кэш"""
+        with self._lock:
+            self._conn.execute("DELETE FROM analysis")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._puts % CACHE_EVICT_EVERY:
+                self._evict()
+            self._conn.close()
+
+
+# ====================================================================
+#                Чтение и анализ с использованием кэша
+# ====================================================================
+def decode_structure(structure):
+    """Структура из JSON кэша: списки снова становятся кортежами, как после анализа"""
+    return [(name, col_count, [tuple(h) for h in headers], header_row)
+            for name, col_count, headers, header_row in structure]
+
+
+def read_sheet_list_cached(path, cache, force=False):
+    """
+    read_sheet_list с кэшем (cache=None — без кэша); force=True — пересканировать файл
+    Возвращает: список [(индекс, название_вкладки), ...] или строку с ошибкой
+    """
+    if cache is None:
+        return read_sheet_list(path)
+
+    if not force:
+        sheets = cache.get(path, "sheets")
+        if sheets is not None:
+            return [tuple(s) for s in sheets]
+
+    sheets = read_sheet_list(path)
+    # Ошибки не кэшируем: файл могли поправить, не меняя размер
+    if isinstance(sheets, list):
+        cache.put(path, "sheets", sheets)
+    return sheets
+
+
+def decode_payload(value):
+    """Результат анализа из JSON кэша: {"structure": ..., "oversized": ...} с кортежами"""
+    return {"structure": decode_structure(value["structure"]),
+            "oversized": [tuple(o) for o in value["oversized"]]}
+
+
+def read_structure_payload_cached(path, cache, force=False):
+    """
+    read_structure_payload с кэшем (cache=None — без кэша); force=True — пересканировать файл
+    Возвращает: {"structure": ..., "oversized": ...} или строку с ошибкой (как пакетный анализ)
+    """
+    if cache is not None and not force:
+        cached = cache.get(path, "structure")
+        if cached is not None:
+            return decode_payload(cached)
+
+    result = read_structure_payload(path)
+    # Ошибки не кэшируем: файл могли поправить, не меняя размер
+    if cache is not None and isinstance(result, dict):
+        cache.put(path, "structure", result)
+    return result
+
+
+def _read_many_cached(func, kind, decode, paths, cache, force, workers):
+    """
+    Общая часть read_sheet_lists_cached и read_structures_cached.
+    Файлы ищутся в кэше пачками по CACHE_LOOKUP_BATCH: найденные выдаются сразу,
+    остальные обрабатываются func в пуле процессов, и только потом берётся
+    следующая пачка. Поэтому первые результаты не ждут отпечатков всех файлов
+    Генератор: (номер_файла, путь, результат)
+    """
+    indexed = list(enumerate(paths, 1))
+
+    for start in range(0, len(indexed), CACHE_LOOKUP_BATCH):
+        batch = indexed[start:start + CACHE_LOOKUP_BATCH]
+        cached = {} if force else cache.get_many([path for _, path in batch], kind)
+
+        missing = []
+        for idx, path in batch:
+            if path in cached:
+                yield (idx, path, decode(cached[path]))
+            else:
+                missing.append((idx, path))
+
+        for local_idx, path, result in map_files_parallel(func, [path for _, path in missing], workers=workers):
+            if not isinstance(result, str):
+                cache.put(path, kind, result)
+            yield (missing[local_idx - 1][0], path, result)
+
+
+def read_sheet_lists_cached(paths, cache, force=False, workers=None):
+    """
+    Списки вкладок для многих файлов: файлы из кэша выдаются сразу,
+    остальные читаются в пуле процессов и сохраняются.
+    Генератор: (номер_файла, путь, список_вкладок или строка с ошибкой)
+    """
+    if cache is None:
+        yield from map_files_parallel(read_sheet_list, paths, workers=workers)
+        return
+
+    yield from _read_many_cached(read_sheet_list, "sheets", lambda value: [tuple(s) for s in value],
+                                 paths, cache, force, workers)
+
+
+def read_structures_cached(paths, cache, force=False, workers=None):
+    """
+    Анализ структуры многих файлов: файлы из кэша выдаются сразу,
+    остальные анализируются в пуле процессов и сохраняются.
+    Генератор: (номер_файла, путь, {"structure": ..., "oversized": ...} или строка с ошибкой)
+    """
+    if cache is None:
+        yield from map_files_parallel(read_structure_payload, paths, workers=workers)
+        return
+
+    yield from _read_many_cached(read_structure_payload, "structure", decode_payload,
+                                 paths, cache, force, workers)
+
+
+# ====================================================================
+#          Модель книги: каждый файл разбирается один раз за сессию
+# ====================================================================
+class WorkbookInfo:
+    """
+    Всё, что известно о книге за сессию: вкладки, их число, анализ заголовков
+    и группы маппинга. Каждая часть читается при первом обращении
+    (с учётом дискового кэша) и дальше берётся из памяти.
+    Анализ заголовков хранится компактно (CompactSheet) со словарём названий vocabulary
+    """
+
+    def __init__(self, path, cache=None, vocabulary=None):
+        self.path = path
+        self.cache = cache
+        self.vocabulary = vocabulary if vocabulary is not None else HeaderVocabulary()
+        self.oversized = []
+        self.structure_error = None  # текст ошибки анализа, если файл не прочитан
+        self._lock = threading.Lock()
+        self._sheets = None  # список вкладок или строка с ошибкой
+        self._structure = None  # [CompactSheet, ...]
+        self._mapping_groups = None
+
+    def has_sheets(self):
+        """Известен ли уже список вкладок (без чтения файла)"""
+        return self._sheets is not None or bool(self._structure)
+
+    def set_sheets(self, sheets):
+        """Запоминает список вкладок, прочитанный снаружи (например, пулом процессов)"""
+        with self._lock:
+            self._sheets = sheets
+
+    def _load_sheets(self, force):
+        with self._lock:
+            if force or self._sheets is None:
+                if not force and self._structure:
+                    # Анализ структуры уже перечислил все вкладки
+                    self._sheets = [(idx, s[0]) for idx, s in enumerate(self._structure, 1)]
+                else:
+                    self._sheets = read_sheet_list_cached(self.path, self.cache, force)
+            return self._sheets
+
+    def get_sheets(self, force=False):
+        """Список [(индекс, название_вкладки), ...]; [] если файл не прочитан"""
+        sheets = self._load_sheets(force)
+        return sheets if isinstance(sheets, list) else []
+
+    def get_sheet_count(self, force=False):
+        """Число вкладок или строка с ошибкой"""
+        sheets = self._load_sheets(force)
+        return len(sheets) if isinstance(sheets, list) else sheets
+
+    def has_structure(self):
+        """Известен ли уже анализ заголовков (без чтения файла)"""
+        return self._structure is not None
+
+    def set_structure(self, structure, oversized=()):
+        """Запоминает анализ заголовков, выполненный снаружи (например, пулом процессов)"""
+        compact = compact_structure(structure, self.vocabulary)
+        with self._lock:
+            self._structure = compact
+            self.oversized = list(oversized)
+            self.structure_error = None
+            self._mapping_groups = None
+
+    def set_structure_error(self, error):
+        """
+        Запоминает ошибку анализа: структура считается пустой (как в get_structure),
+        а ошибка сохраняется, чтобы повторный просмотр снова показал файл как ошибочный
+        """
+        with self._lock:
+            self._structure = []
+            self.oversized = []
+            self.structure_error = error
+            self._mapping_groups = None
+
+    def get_compact_structure(self, force=False):
+        """Анализ заголовков в компактном виде: [CompactSheet, ...]"""
+        with self._lock:
+            if force or self._structure is None:
+                result = read_structure_payload_cached(self.path, self.cache, force)
+                if isinstance(result, str):
+                    # Как в scan_structures: пустая структура, ошибка запоминается
+                    self._structure = []
+                    self.oversized = []
+                    self.structure_error = result
+                else:
+                    self._structure = compact_structure(result["structure"], self.vocabulary)
+                    self.oversized = result["oversized"]
+                    self.structure_error = None
+                self._mapping_groups = None
+            return self._structure
+
+    def get_structure(self, force=False):
+        """Результат analyze_file_structure для файла"""
+        return expand_structure(self.get_compact_structure(force), self.vocabulary)
+
+    def get_mapping_groups(self, force=False):
+        """Результат group_sheets_by_mapping для структуры файла"""
+        structure = self.get_structure(force)
+        with self._lock:
+            if self._mapping_groups is None:
+                self._mapping_groups = group_sheets_by_mapping(structure)
+            return self._mapping_groups
+
+
+class WorkbookRegistry:
+    """
+    Модели книг текущей сессии по пути к файлу.
+    Все книги делят один словарь названий столбцов (vocabulary)
+    """
+
+    def __init__(self, cache=None):
+        self.cache = cache
+        self.vocabulary = HeaderVocabulary()
+        self._infos = {}
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """Возвращает WorkbookInfo файла, создавая её при первом обращении"""
+        with self._lock:
+            info = self._infos.get(path)
+            if info is None:
+                info = self._infos[path] = WorkbookInfo(path, self.cache, self.vocabulary)
+            return info
+
+    def clear(self):
+        """
+        Забывает все книги. Словарь названий заводится новый: иначе названия
+        и наборы заголовков всех когда-либо открытых списков копились бы в памяти
+        """
+        with self._lock:
+            self._infos.clear()
+            self.vocabulary = HeaderVocabulary()
+
+    def scan_sheets(self, paths, force=False, workers=None):
+        """
+        Заполняет списки вкладок для многих файлов: известные берутся из памяти,
+        остальные — из дискового кэша или читаются пулом процессов.
+        Генератор: (номер_файла, WorkbookInfo) по мере готовности
+        """
+        infos = [self.get(path) for path in paths]
+        pending = []
+
+        for idx, info in enumerate(infos, 1):
+            if force or not info.has_sheets():
+                pending.append((idx, info))
+            else:
+                yield (idx, info)
+
+        results = read_sheet_lists_cached([info.path for _, info in pending], self.cache, force, workers)
+        for local_idx, path, sheets in results:
+            idx, info = pending[local_idx - 1]
+            info.set_sheets(sheets)
+            yield (idx, info)
+
+    def scan_structures(self, paths, force=False, workers=None):
+        """
+        Заполняет анализ заголовков для многих файлов: известные берутся из памяти,
+        остальные — из дискового кэша или анализируются пулом процессов.
+        Файлы с ошибкой получают пустую структуру, как в get_structure, а ошибка
+        запоминается в WorkbookInfo и выдаётся снова при следующих просмотрах.
+        Генератор: (номер_файла, WorkbookInfo, ошибка или None) по мере готовности
+        """
+        infos = [self.get(path) for path in paths]
+        pending = []
+
+        for idx, info in enumerate(infos, 1):
+            if force or not info.has_structure():
+                pending.append((idx, info))
+            else:
+                yield (idx, info, info.structure_error)
+
+        results = read_structures_cached([info.path for _, info in pending], self.cache, force, workers)
+        for local_idx, path, result in results:
+            idx, info = pending[local_idx - 1]
+            if isinstance(result, str):
+                info.set_structure_error(result)
+                yield (idx, info, result)
+            else:
+                info.set_structure(result["structure"], result["oversized"])
+                yield (idx, info, None)
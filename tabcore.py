@@ -0,0 +1,1587 @@
+import os
+import sys
+import errno
+import json
+import mmap
+import random
+import hashlib
+import zipfile
+import posixpath
+import threading
+import xml.etree.ElementTree as ET
+from array import array
+from collections import namedtuple
+from itertools import groupby
+from operator import itemgetter
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Excel библиотеки
+import xlrd  # для XLS
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+from openpyxl.utils.cell import coordinate_to_tuple, range_boundaries
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel, from_ISO8601
+
+
+# ====================================================================
+#                  Учёт открытых файлов и книг
+# ====================================================================
+# Все пути чтения открывают файлы только через контекстные менеджеры ниже,
+# поэтому zip-архивы, отображения и книги xlrd/openpyxl закрываются сразу
+# после чтения, а не при сборке мусора. Счётчик показывает, сколько
+# дескрипторов каждого вида открыто сейчас в этом процессе: после пакета
+# он должен вернуться к нулю, иначе где-то утечка.
+
+class HandleCounter:
+    """Потокобезопасный счётчик открытых и закрытых дескрипторов по видам"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._opened = {}
+        self._closed = {}
+
+    def opened(self, kind):
+        with self._lock:
+            self._opened[kind] = self._opened.get(kind, 0) + 1
+
+    def closed(self, kind):
+        with self._lock:
+            self._closed[kind] = self._closed.get(kind, 0) + 1
+
+    @contextmanager
+    def track(self, kind):
+        """Учитывает дескриптор открытым на время блока with"""
+        self.opened(kind)
+        try:
+            yield
+        finally:
+            self.closed(kind)
+
+    def open_count(self, kind=None):
+        """Сколько дескрипторов вида kind (или всех видов) открыто сейчас"""
+        with self._lock:
+            kinds = [kind] if kind else list(self._opened)
+            return sum(self._opened.get(k, 0) - self._closed.get(k, 0) for k in kinds)
+
+    def stats(self):
+        """Словарь {вид: {"open": ..., "opened": ..., "closed": ...}}"""
+        with self._lock:
+            return {kind: {"open": opened - self._closed.get(kind, 0),
+                           "opened": opened,
+                           "closed": self._closed.get(kind, 0)}
+                    for kind, opened in self._opened.items()}
+
+
+# Счётчик процесса (в процессах-воркерах — свой)
+handle_counter = HandleCounter()
+
+
+def open_handle_count(kind=None):
+    """Число открытых сейчас файлов/книг: 'file', 'xlsx_book', 'xls_book', 'openpyxl_book'"""
+    return handle_counter.open_count(kind)
+
+
+def handle_stats():
+    """Статистика открытий и закрытий по видам дескрипторов"""
+    return handle_counter.stats()
+
+
+# ====================================================================
+#              Доступ к архиву XLSX через отображение в память
+# ====================================================================
+# Файл отображается в память целиком (mmap), и zipfile читает центральный
+# каталог и части архива прямо из отображения: без буферизованного чтения
+# и лишних системных вызовов на каждый seek. Страницы подгружает ОС,
+# и они не учитываются как собственная память процесса.
+
+# False — открывать файлы обычным образом
+USE_MMAP = True
+
+
+class _MappedFile:
+    """Файловый объект только для чтения поверх mmap (для zipfile и openpyxl)"""
+
+    def __init__(self, mm, name=None):
+        self._mm = mm
+        self.name = name
+
+    def read(self, size=-1):
+        return self._mm.read(None if size is None or size < 0 else size)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        # mmap.seek бросает ValueError на позициях вне файла, а zipfile ждёт OSError,
+        # как у обычного файла (иначе короткий файл не распознаётся как «не zip»).
+        # Позиция за концом файла ограничивается его размером: read всё равно вернёт b""
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._mm.tell(), os.SEEK_END: len(self._mm)}[whence]
+        position = base + offset
+        if position < 0:
+            raise OSError(errno.EINVAL, "Invalid argument")
+        self._mm.seek(min(position, len(self._mm)))
+        return self._mm.tell()
+
+    def tell(self):
+        return self._mm.tell()
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def close(self):
+        # Отображение закрывает open_mapped_file
+        pass
+
+
+@contextmanager
+def open_mapped_file(path):
+    """
+    Открывает файл для чтения, по возможности через mmap.
+    Пустые файлы и файловые системы без поддержки mmap читаются обычным образом.
+    Возвращает: файловый объект, пригодный для zipfile.ZipFile и load_workbook
+    """
+    with handle_counter.track("file"), open(path, "rb") as f:
+        mm = None
+        if USE_MMAP:
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                mm = None
+
+        if mm is None:
+            yield f
+            return
+
+        try:
+            yield _MappedFile(mm, path)
+        finally:
+            mm.close()
+
+
+@contextmanager
+def open_xlsx_archive(path):
+    """Открывает XLSX/XLSM как zip-архив поверх open_mapped_file"""
+    with open_mapped_file(path) as f:
+        with zipfile.ZipFile(f) as zf:
+            yield zf
+
+
+@contextmanager
+def open_xlsx_book(path):
+    """Открывает XLSX/XLSM для потокового чтения листов (XlsxBookReader) и закрывает всё на выходе"""
+    with open_xlsx_archive(path) as zf:
+        with XlsxBookReader(zf) as book:
+            yield book
+
+
+@contextmanager
+def open_xls_book(path, **kwargs):
+    """
+    Открывает XLS через xlrd (on_demand=True по умолчанию) и на выходе
+    освобождает ресурсы книги: mmap файла и загруженные листы
+    """
+    kwargs.setdefault("on_demand", True)
+    with handle_counter.track("xls_book"):
+        wb = xlrd.open_workbook(path, **kwargs)
+        try:
+            yield wb
+        finally:
+            wb.release_resources()
+
+
+@contextmanager
+def open_read_only_workbook(path, **kwargs):
+    """
+    Открывает XLSX/XLSM через openpyxl в режиме read_only и закрывает на выходе.
+    Без close() read-only книга держит zip-архив открытым до сборки мусора
+    """
+    from openpyxl import load_workbook
+
+    with handle_counter.track("openpyxl_book"), open_mapped_file(path) as f:
+        wb = load_workbook(f, read_only=True, **kwargs)
+        try:
+            yield wb
+        finally:
+            wb.close()
+
+
+# ====================================================================
+#              Быстрое чтение метаданных XLSX (без openpyxl)
+# ====================================================================
+# Для подсчёта и списка вкладок не нужно загружать книгу целиком:
+# достаточно открыть zip-архив и прочитать только xl/workbook.xml.
+# openpyxl используется лишь там, где нужны данные ячеек.
+
+REL_OFFICE_DOCUMENT = "/officeDocument"
+
+SheetMeta = namedtuple("SheetMeta", ["index", "name", "sheet_id", "state", "rel_id"])
+
+
+def _local_name(tag):
+    """Отбрасывает пространство имён: '{ns}sheet' -> 'sheet'"""
+    return tag.rsplit("}", 1)[-1]
+
+
+def _find_workbook_part(zf):
+    """
+    Находит путь к workbook.xml внутри архива.
+    Обычно это xl/workbook.xml, иначе смотрим корневые связи _rels/.rels
+    """
+    names = set(zf.namelist())
+    if "xl/workbook.xml" in names:
+        return "xl/workbook.xml"
+
+    if "_rels/.rels" in names:
+        with zf.open("_rels/.rels") as f:
+            for _, elem in ET.iterparse(f):
+                if _local_name(elem.tag) == "Relationship" and elem.get("Type", "").endswith(REL_OFFICE_DOCUMENT):
+                    return elem.get("Target", "").lstrip("/")
+
+    raise KeyError("В архиве не найден workbook.xml")
+
+
+def _read_workbook_xml(zf, workbook_part):
+    """
+    Разбирает workbook.xml до конца блока <sheets>
+    Возвращает: (список SheetMeta, используется ли система дат 1904)
+    """
+    sheets = []
+    date1904 = False
+
+    with zf.open(workbook_part) as f:
+        for event, elem in ET.iterparse(f, events=("end",)):
+            tag = _local_name(elem.tag)
+
+            if tag == "sheet":
+                rel_id = None
+                for key, value in elem.attrib.items():
+                    if _local_name(key) == "id" and key.startswith("{"):
+                        rel_id = value
+                        break
+
+                sheet_id = elem.get("sheetId")
+                sheets.append(SheetMeta(
+                    len(sheets) + 1,
+                    elem.get("name", ""),
+                    int(sheet_id) if sheet_id and sheet_id.isdigit() else None,
+                    elem.get("state", "visible"),
+                    rel_id,
+                ))
+
+            elif tag == "workbookPr":
+                date1904 = elem.get("date1904", "").lower() in ["1", "true"]
+
+            elif tag == "sheets":
+                # Остальная часть workbook.xml (definedNames, calcPr...) не нужна
+                break
+
+    return sheets, date1904
+
+
+def read_xlsx_sheets(path):
+    """
+    Читает список вкладок XLSX/XLSM напрямую из xl/workbook.xml.
+    Разбор останавливается сразу после блока <sheets>.
+    Возвращает: список SheetMeta(индекс, название, sheetId, состояние, r:id)
+    Состояние: 'visible', 'hidden' или 'veryHidden'
+    """
+    with open_xlsx_archive(path) as zf:
+        return _read_workbook_xml(zf, _find_workbook_part(zf))[0]
+
+
+# ====================================================================
+#                      Подсчёт вкладок Excel
+# ====================================================================
+def read_sheet_list(path):
+    """
+    Читает список вкладок файла (общая основа подсчёта и списка вкладок)
+    Возвращает: список [(индекс, название_вкладки), ...] или строку с ошибкой
+    """
+    ext = os.path.splitext(path)[1].lower()
+
+    try:
+        if ext in [".xlsx", ".xlsm"]:
+            return [(meta.index, meta.name) for meta in read_xlsx_sheets(path)]
+
+        elif ext == ".xls":
+            # on_demand: читаются только записи BOF/BOUNDSHEET, листы не декодируются
+            with open_xls_book(path) as wb:
+                return [(idx, name) for idx, name in enumerate(wb.sheet_names(), 1)]
+
+        else:
+            return "Неподдерживаемый формат"
+
+    except Exception as e:
+        return f"Ошибка: {e}"
+
+
+def count_sheets_in_file(path):
+    sheets = read_sheet_list(path)
+    return len(sheets) if isinstance(sheets, list) else sheets
+
+
+# ====================================================================
+#                   Получение списка вкладок с индексами
+# ====================================================================
+def get_sheet_names(path):
+    """Возвращает список кортежей (индекс, название вкладки)"""
+    sheets = read_sheet_list(path)
+    return sheets if isinstance(sheets, list) else []
+
+
+# ====================================================================
+#                   Анализ столбцов и заголовков
+# ====================================================================
+# Ограничение числа просматриваемых колонок в строке (None — без ограничения)
+MAX_HEADER_COLUMNS = None
+
+# Лист считается «раздутым», если ширина из <dimension> намного больше
+# реально встреченной (типично для выгрузок с ref="A1:XFD1048576")
+OVERSIZED_DIMENSION_RATIO = 10
+OVERSIZED_DIMENSION_MIN_COLS = 100
+
+
+def is_dimension_oversized(declared_cols, real_cols):
+    """Проверяет, что заявленная ширина листа намного больше реальной"""
+    if not declared_cols:
+        return False
+    return (declared_cols >= OVERSIZED_DIMENSION_MIN_COLS
+            and declared_cols >= max(real_cols, 1) * OVERSIZED_DIMENSION_RATIO)
+
+
+def _used_width(values):
+    """Номер последней непустой ячейки строки (0 — пустая строка); дополнение до max_cols не считается"""
+    for col_idx in range(len(values), 0, -1):
+        if values[col_idx - 1] is not None:
+            return col_idx
+    return 0
+
+
+def _find_header_cells(values):
+    """
+    Ищет в строке первый блок из 4+ заполненных ячеек подряд
+    Возвращает: список [(номер_колонки, название), ...] или None
+    """
+    row_cells = []
+
+    for col_idx, value in enumerate(values, 1):
+        text = str(value).strip() if value is not None else ""
+
+        if text:
+            row_cells.append((col_idx, text))
+        else:
+            # Если был блок заполненных ячеек >= 4, это заголовок
+            if len(row_cells) >= 4:
+                return row_cells
+            # Сброс блока
+            row_cells = []
+
+    # Проверка в конце строки
+    if len(row_cells) >= 4:
+        return row_cells
+
+    return None
+
+
+def find_header_row(sheet, max_rows=50, max_cols=MAX_HEADER_COLUMNS, extent=None):
+    """
+    Ищет строку с заголовками (как минимум 4 заполненных ячейки подряд)
+    Строки читаются один раз потоком iter_rows, без sheet.cell(),
+    и чтение прекращается на первой подходящей строке.
+    Учитываются только реально существующие ячейки строки, а не ширина
+    из <dimension>; max_cols дополнительно ограничивает число колонок.
+    Если передан словарь extent, в него записываются заявленная
+    (declared_cols) и реальная (real_cols) ширина просмотренных строк:
+    по последней непустой ячейке. Если по строкам до заголовка лист выглядит
+    «раздутым», ширина досчитывается по остальным строкам в пределах max_rows,
+    чтобы узкий заголовок над широкими данными не считался завышенным <dimension>.
+    Возвращает: (номер_строки, список_заголовков) или (None, [])
+    """
+    read_only = hasattr(sheet, "reset_dimensions")
+    declared_cols = sheet.max_column or 0
+    last_row = min(max_rows, sheet.max_row or max_rows)
+
+    max_col = max_cols
+    if read_only:
+        # Размер read-only листа берётся из <dimension>, которому нельзя доверять:
+        # без него строки обрезаются по последней существующей ячейке
+        sheet.reset_dimensions()
+    elif max_cols:
+        # Обычный лист создаёт ячейки при обращении за пределы max_column
+        max_col = min(max_cols, declared_cols or max_cols)
+
+    real_cols = 0
+    result = (None, [])
+    rows = sheet.iter_rows(min_row=1, max_row=last_row, max_col=max_col, values_only=True)
+
+    try:
+        for row_idx, values in enumerate(rows, 1):
+            real_cols = max(real_cols, _used_width(values))
+            row_cells = _find_header_cells(values)
+            if row_cells:
+                result = (row_idx, row_cells)
+                break
+
+        if extent is not None and is_dimension_oversized(declared_cols, real_cols):
+            for values in rows:
+                real_cols = max(real_cols, _used_width(values))
+    finally:
+        # Закрываем поток строк, чтобы не дочитывать XML листа
+        rows.close()
+
+    if extent is not None:
+        extent["declared_cols"] = declared_cols
+        extent["real_cols"] = real_cols
+
+    return result
+
+
+def find_header_row_xls(sheet, max_rows=50, max_cols=MAX_HEADER_COLUMNS):
+    """
+    Ищет строку с заголовками для XLS файлов
+    Возвращает: (номер_строки, список_заголовков) или (None, [])
+    """
+    for row_idx in range(min(max_rows, sheet.nrows)):
+        row_cells = _find_header_cells(sheet.row_values(row_idx, 0, max_cols))
+        if row_cells:
+            return (row_idx + 1, row_cells)
+
+    return (None, [])
+
+
+# ====================================================================
+#          Потоковое чтение первых строк листа XLSX (без openpyxl)
+# ====================================================================
+# Для поиска заголовков нужны только первые строки листа. XML листа
+# разбирается потоком (iterparse) прямо из архива, и распаковка
+# прекращается сразу после последней нужной строки: лист в миллион строк
+# анализируется так же быстро, как лист в 50 строк.
+# Значения ячеек приводятся так же, как в openpyxl с data_only=True.
+
+REL_SHARED_STRINGS = "/sharedStrings"
+REL_STYLES = "/styles"
+
+
+def _resolve_part(folder, target):
+    """Путь к части архива по Target из файла связей"""
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join(folder, target))
+
+
+def _read_relationships(zf, part, names):
+    """
+    Читает связи части архива (например, xl/_rels/workbook.xml.rels)
+    Возвращает: словарь {r:id: (тип_связи, путь_к_части)}
+    """
+    folder, name = posixpath.split(part)
+    rels_part = posixpath.join(folder, "_rels", name + ".rels")
+    rels = {}
+
+    if rels_part not in names:
+        return rels
+
+    with zf.open(rels_part) as f:
+        for _, elem in ET.iterparse(f):
+            if _local_name(elem.tag) == "Relationship" and elem.get("TargetMode") != "External":
+                rels[elem.get("Id")] = (elem.get("Type", ""), _resolve_part(folder, elem.get("Target", "")))
+
+    return rels
+
+
+def _text_content(elem):
+    """Текст <si> или <is> без форматирования: <t> и все <r><t> подряд"""
+    plain = ""
+    runs = []
+
+    for child in elem:
+        tag = _local_name(child.tag)
+        if tag == "t":
+            plain = child.text or ""
+        elif tag == "r":
+            for part in child:
+                if _local_name(part.tag) == "t":
+                    runs.append(part.text or "")
+
+    return plain + "".join(runs)
+
+
+def _cast_number(value):
+    """Число из XML ячейки: int или float, как в openpyxl"""
+    if "." in value or "E" in value or "e" in value:
+        return float(value)
+    return int(value)
+
+
+class SharedStringsReader:
+    """
+    Таблица общих строк (xl/sharedStrings.xml), читаемая по требованию.
+    Вся таблица в памяти не нужна: заголовки ссылаются лишь на несколько строк,
+    и обычно на первые (Excel нумерует строки в порядке первого появления).
+    Файл разбирается потоком только до запрошенного номера, пройденные <si>
+    сразу выбрасываются, и в памяти остаются только запрошенные строки.
+    Поток остаётся открытым для следующих номеров; за уже пройденной
+    строкой разбор начинается с начала файла
+    """
+
+    def __init__(self, zf, part):
+        self.zf = zf
+        self.part = part
+        self._strings = {}
+        self._stream = None
+        self._events = None
+        self._root = None
+        self._next_index = 0
+
+    def _restart(self):
+        self.close()
+        self._stream = self.zf.open(self.part)
+        self._events = ET.iterparse(self._stream, events=("start", "end"))
+        self._root = None
+        self._next_index = 0
+
+    def __getitem__(self, index):
+        value = self._strings.get(index)
+        if value is not None:
+            return value
+
+        if self.part is None or index < 0:
+            raise IndexError(f"Нет общей строки с номером {index}")
+
+        if self._events is None or index < self._next_index:
+            self._restart()
+
+        for event, elem in self._events:
+            if event == "start":
+                if self._root is None:
+                    self._root = elem
+                continue
+
+            if _local_name(elem.tag) != "si":
+                continue
+
+            if self._next_index == index:
+                value = self._strings[index] = _text_content(elem).replace("x005F_", "")
+            self._next_index += 1
+
+            # Пройденные <si> не накапливаются в дереве
+            self._root.clear()
+
+            if value is not None:
+                return value
+
+        self.close()
+        raise IndexError(f"Нет общей строки с номером {index}")
+
+    def close(self):
+        """Закрывает поток разбора; уже прочитанные строки остаются доступны"""
+        if self._stream is not None:
+            self._stream.close()
+        self._stream = None
+        self._events = None
+        self._root = None
+
+
+class XlsxBookReader:
+    """
+    Открытый XLSX-архив для потокового чтения листов.
+    Таблица общих строк и стили читаются только при первой необходимости.
+    После использования нужно вызвать close() (или открыть через with / open_xlsx_book)
+    """
+
+    def __init__(self, zf):
+        self.zf = zf
+        self._is_open = False
+        self._names = set(zf.namelist())
+
+        workbook_part = _find_workbook_part(zf)
+        sheets, date1904 = _read_workbook_xml(zf, workbook_part)
+        self.epoch = CALENDAR_MAC_1904 if date1904 else CALENDAR_WINDOWS_1900
+
+        rels = _read_relationships(zf, workbook_part, self._names)
+        self._shared_strings_part = self._find_part(rels, REL_SHARED_STRINGS, "xl/sharedStrings.xml")
+        self._styles_part = self._find_part(rels, REL_STYLES, "xl/styles.xml")
+
+        # Вкладки, XML которых есть в архиве: [(SheetMeta, путь_к_XML_листа), ...]
+        self.sheets = []
+        for meta in sheets:
+            rel = rels.get(meta.rel_id)
+            if rel and rel[1] in self._names:
+                self.sheets.append((meta, rel[1]))
+
+        self._shared_strings = None
+        self._date_styles = None
+
+        self._is_open = True
+        handle_counter.opened("xlsx_book")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _find_part(self, rels, rel_type, default):
+        for target_type, part in rels.values():
+            if target_type.endswith(rel_type) and part in self._names:
+                return part
+        return default if default in self._names else None
+
+    def shared_string(self, index):
+        """Строка из xl/sharedStrings.xml по номеру (читается по требованию)"""
+        if self._shared_strings is None:
+            self._shared_strings = SharedStringsReader(self.zf, self._shared_strings_part)
+        return self._shared_strings[index]
+
+    def close(self):
+        """Прекращает незавершённое чтение таблицы общих строк и освобождает кэши книги"""
+        if self._shared_strings is not None:
+            self._shared_strings.close()
+        self._shared_strings = None
+        self._date_styles = None
+
+        if self._is_open:
+            self._is_open = False
+            handle_counter.closed("xlsx_book")
+
+    def _get_date_styles(self):
+        """
+        Номера стилей ячеек (cellXfs) с форматом даты и с форматом длительности
+        Возвращает: (множество_стилей_дат, множество_стилей_длительностей)
+        """
+        if self._date_styles is None:
+            custom = {}
+            num_fmt_ids = []
+
+            if self._styles_part:
+                in_cell_xfs = False
+                with self.zf.open(self._styles_part) as f:
+                    for event, elem in ET.iterparse(f, events=("start", "end")):
+                        tag = _local_name(elem.tag)
+                        if tag == "cellXfs":
+                            in_cell_xfs = event == "start"
+                            if not in_cell_xfs:
+                                break
+                        elif event == "end" and tag == "numFmt":
+                            custom[int(elem.get("numFmtId", 0))] = elem.get("formatCode", "")
+                        elif event == "end" and tag == "xf" and in_cell_xfs:
+                            num_fmt_ids.append(int(elem.get("numFmtId", 0)))
+
+            date_styles = set()
+            timedelta_styles = set()
+            for style_id, num_fmt_id in enumerate(num_fmt_ids):
+                fmt = custom[num_fmt_id] if num_fmt_id in custom else BUILTIN_FORMATS.get(num_fmt_id)
+                if is_date_format(fmt):
+                    date_styles.add(style_id)
+                if is_timedelta_format(fmt):
+                    timedelta_styles.add(style_id)
+
+            self._date_styles = (date_styles, timedelta_styles)
+
+        return self._date_styles
+
+    def cell_value(self, cell):
+        """Значение элемента <c>: str, int, float, bool, datetime или None"""
+        data_type = cell.get("t", "n")
+
+        if data_type == "inlineStr":
+            for child in cell:
+                if _local_name(child.tag) == "is":
+                    return _text_content(child)
+            return None
+
+        value = None
+        for child in cell:
+            if _local_name(child.tag) == "v":
+                value = child.text or None
+                break
+
+        if value is None:
+            return None
+
+        if data_type == "n":
+            value = _cast_number(value)
+            date_styles, timedelta_styles = self._get_date_styles()
+            style_id = int(cell.get("s") or 0)
+            if style_id in date_styles:
+                try:
+                    value = from_excel(value, self.epoch, timedelta=style_id in timedelta_styles)
+                except (OverflowError, ValueError):
+                    value = "#VALUE!"
+        elif data_type == "s":
+            value = self.shared_string(int(value))
+        elif data_type == "b":
+            value = bool(int(value))
+        elif data_type == "d":
+            value = from_ISO8601(value)
+
+        return value
+
+    def iter_rows(self, part, max_rows=None, max_cols=None, dimension=None):
+        """
+        Генератор значений строк листа с первой, как iter_rows(values_only=True)
+        у read-only листа openpyxl после reset_dimensions: пропущенные строки
+        выдаются пустыми, строка обрезается по последней ячейке (или max_cols).
+        Читается не больше max_rows строк и не дальше последней строки из <dimension>.
+        Если передан словарь dimension, в него записываются max_row и max_col из <dimension>
+        """
+        if dimension is None:
+            dimension = {}
+        dimension.setdefault("max_row", None)
+        dimension.setdefault("max_col", None)
+
+        empty_row = (None,) * max_cols if max_cols else ()
+        last_row = max_rows
+        row_num = 0
+        col_num = 0
+        next_row = 1
+
+        with self.zf.open(part) as f:
+            for event, elem in ET.iterparse(f, events=("start", "end")):
+                tag = _local_name(elem.tag)
+
+                if event == "start":
+                    if tag == "sheetData":
+                        max_row = dimension["max_row"]
+                        if max_row and (last_row is None or max_row < last_row):
+                            last_row = max_row
+                        if last_row is not None and last_row < 1:
+                            return
+                    continue
+
+                if tag == "dimension":
+                    try:
+                        _, _, dimension["max_col"], dimension["max_row"] = range_boundaries(elem.get("ref", ""))
+                    except (TypeError, ValueError):
+                        pass
+
+                elif tag == "row":
+                    ref = elem.get("r")
+                    row_num = int(float(ref)) if ref else row_num + 1
+                    col_num = 0
+
+                    if last_row is not None and row_num > last_row:
+                        # Строки до последней нужной отсутствуют в XML
+                        for _ in range(next_row, last_row + 1):
+                            yield empty_row
+                        return
+
+                    cells = []
+                    for cell in elem:
+                        ref = cell.get("r")
+                        col_num = coordinate_to_tuple(ref)[1] if ref else col_num + 1
+                        cells.append((col_num, self.cell_value(cell)))
+                    elem.clear()
+
+                    for _ in range(next_row, row_num):
+                        next_row += 1
+                        yield empty_row
+
+                    if next_row <= row_num:
+                        next_row += 1
+                        if cells or max_cols:
+                            values = [None] * (max_cols or cells[-1][0])
+                            for col_idx, value in cells:
+                                if 1 <= col_idx <= len(values):
+                                    values[col_idx - 1] = value
+                            yield tuple(values)
+                        else:
+                            yield ()
+
+                    if last_row is not None and row_num >= last_row:
+                        # Дальше XML листа не распаковывается
+                        return
+
+                elif tag == "sheetData":
+                    return
+
+
+def find_header_row_xlsx(book, part, max_rows=50, max_cols=MAX_HEADER_COLUMNS, extent=None):
+    """
+    То же, что find_header_row, но для листа XLSX, читаемого потоком через XlsxBookReader.
+    part — путь к XML листа в архиве (из book.sheets)
+    Возвращает: (номер_строки, список_заголовков) или (None, [])
+    """
+    dimension = {}
+    real_cols = 0
+    result = (None, [])
+    rows = book.iter_rows(part, max_rows, max_cols, dimension)
+
+    try:
+        for row_idx, values in enumerate(rows, 1):
+            real_cols = max(real_cols, _used_width(values))
+            row_cells = _find_header_cells(values)
+            if row_cells:
+                result = (row_idx, row_cells)
+                break
+
+        # Ширина досчитывается, только если лист похож на «раздутый» (см. find_header_row)
+        if extent is not None and is_dimension_oversized(dimension["max_col"], real_cols):
+            for values in rows:
+                real_cols = max(real_cols, _used_width(values))
+    finally:
+        # Закрываем поток строк, чтобы не распаковывать остаток листа
+        rows.close()
+
+    if extent is not None:
+        extent["declared_cols"] = dimension["max_col"] or 0
+        extent["real_cols"] = real_cols
+
+    return result
+
+
+def read_file_structure(path, max_cols=MAX_HEADER_COLUMNS, oversized=None):
+    """
+    Анализирует структуру файла: для каждой вкладки находит заголовки
+    Если передан список oversized, в него добавляются вкладки с завышенным
+    <dimension>: (название_вкладки, заявлено_столбцов, реально_столбцов)
+    Возвращает: список [(название_вкладки, количество_столбцов, список_заголовков, номер_строки), ...]
+    или строку с ошибкой
+    """
+    ext = os.path.splitext(path)[1].lower()
+    results = []
+    
+    try:
+        if ext in [".xlsx", ".xlsm"]:
+            # Листы читаются потоком только до строки с заголовками
+            with open_xlsx_book(path) as book:
+                for meta, part in book.sheets:
+                    sheet_name = meta.name
+                    extent = {}
+                    header_row, headers = find_header_row_xlsx(book, part, max_cols=max_cols, extent=extent)
+
+                    if oversized is not None and is_dimension_oversized(extent["declared_cols"], extent["real_cols"]):
+                        oversized.append((sheet_name, extent["declared_cols"], extent["real_cols"]))
+
+                    if header_row:
+                        results.append((sheet_name, len(headers), headers, header_row))
+                    else:
+                        results.append((sheet_name, 0, [], None))
+        
+        elif ext == ".xls":
+            # ragged_rows: строки не дополняются пустыми ячейками до ширины листа
+            # on_demand: листы загружаются по одному и сразу выгружаются,
+            # в памяти одновременно не больше одного листа
+            with open_xls_book(path, ragged_rows=True) as wb:
+                for sheet_idx in range(wb.nsheets):
+                    sheet = wb.sheet_by_index(sheet_idx)
+                    header_row, headers = find_header_row_xls(sheet, max_cols=max_cols)
+                    
+                    if header_row:
+                        results.append((sheet.name, len(headers), headers, header_row))
+                    else:
+                        results.append((sheet.name, 0, [], None))
+
+                    wb.unload_sheet(sheet_idx)
+
+        else:
+            return "Неподдерживаемый формат"
+        
+        return results
+    
+    except Exception as e:
+        return f"Ошибка: {e}"
+
+
+def analyze_file_structure(path, max_cols=MAX_HEADER_COLUMNS, oversized=None):
+    """
+    То же, что read_file_structure, но при ошибке печатает её и возвращает []
+    """
+    structure = read_file_structure(path, max_cols, oversized)
+
+    if isinstance(structure, str):
+        print(f"Ошибка анализа файла: {structure}")
+        return []
+
+    return structure
+
+
+def read_structure_payload(path, max_cols=MAX_HEADER_COLUMNS):
+    """
+    Анализ структуры для процесса-воркера и кэша
+    Возвращает: {"structure": ..., "oversized": ...} или строку с ошибкой
+    """
+    oversized = []
+    structure = read_file_structure(path, max_cols, oversized)
+    if isinstance(structure, str):
+        return structure
+    return {"structure": structure, "oversized": oversized}
+
+
+def get_column_letter(col_num):
+    """Конвертирует номер колонки в буквенное обозначение Excel (1 -> A, 27 -> AA)"""
+    result = ""
+    while col_num > 0:
+        col_num -= 1
+        result = chr(65 + (col_num % 26)) + result
+        col_num //= 26
+    return result
+
+
+# ====================================================================
+#                   Сравнение маппинга столбцов
+# ====================================================================
+def get_column_signature(headers):
+    """
+    Создаёт сигнатуру столбцов для сравнения (только названия, без индексов)
+    """
+    if not headers:
+        return None
+    # Берём только названия столбцов (игнорируем их позиции)
+    return tuple(name.lower().strip() for idx, name in headers)
+
+
+def group_sheets_by_mapping(structure):
+    """
+    Группирует вкладки по одинаковому маппингу столбцов
+    Возвращает: словарь {signature: [список_индексов_вкладок]}
+    """
+    mapping_groups = {}
+    
+    for idx, (sheet_name, col_count, headers, header_row) in enumerate(structure):
+        signature = get_column_signature(headers)
+        
+        if signature is None:
+            continue
+        
+        if signature not in mapping_groups:
+            mapping_groups[signature] = []
+        
+        mapping_groups[signature].append(idx)
+    
+    return mapping_groups
+
+
+# ====================================================================
+#           Похожие маппинги: кластеризация MinHash + LSH
+# ====================================================================
+# Точное сравнение считает вкладку с одним переименованным или лишним
+# столбцом «уникальной». Здесь маппинги сравниваются по мере Жаккара
+# множеств названий столбцов. Чтобы не сравнивать все пары, для каждого
+# маппинга строится MinHash-подпись, а кандидаты ищутся по корзинам LSH.
+
+MINHASH_PERMUTATIONS = 64
+MINHASH_SEED = 1
+
+# Порог сходства по умолчанию (доля общих столбцов от объединения)
+SIMILARITY_THRESHOLD = 0.8
+
+# Вероятность, с которой LSH находит пару на пороге сходства
+LSH_RECALL = 0.98
+
+_MINHASH_PRIME = (1 << 61) - 1
+
+
+def jaccard_similarity(a, b):
+    """Мера Жаккара двух множеств: |a ∩ b| / |a ∪ b|"""
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def diff_signatures(representative, signature):
+    """
+    Отличие маппинга от представителя кластера
+    Возвращает: (лишние_столбцы, недостающие_столбцы) в порядке следования
+    """
+    rep_names = set(representative)
+    own_names = set(signature)
+    return ([name for name in signature if name not in rep_names],
+            [name for name in representative if name not in own_names])
+
+
+def _lsh_bands(threshold, num_perm):
+    """
+    Разбиение подписи на полосы: (число_полос, строк_в_полосе).
+    Берутся самые длинные полосы (меньше лишних кандидатов), при которых пара
+    со сходством ровно threshold попадает в общую корзину с вероятностью
+    не ниже LSH_RECALL
+    """
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        if 1 - (1 - threshold ** rows) ** bands >= LSH_RECALL:
+            best = (bands, rows)
+    return best
+
+
+class MinHasher:
+    """MinHash-подписи множеств строк; значения для каждого названия считаются один раз"""
+
+    def __init__(self, num_perm=MINHASH_PERMUTATIONS, seed=MINHASH_SEED):
+        rnd = random.Random(seed)
+        self._params = [(rnd.randrange(1, _MINHASH_PRIME), rnd.randrange(0, _MINHASH_PRIME))
+                        for _ in range(num_perm)]
+        self._token_values = {}
+
+    def _values(self, token):
+        values = self._token_values.get(token)
+        if values is None:
+            x = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+            values = self._token_values[token] = tuple((a * x + b) % _MINHASH_PRIME for a, b in self._params)
+        return values
+
+    def signature(self, tokens):
+        """Подпись непустого множества: минимум по каждой перестановке"""
+        return tuple(map(min, zip(*[self._values(token) for token in tokens])))
+
+
+def cluster_similar_signatures(signatures, threshold=SIMILARITY_THRESHOLD,
+                               weights=None, num_perm=MINHASH_PERMUTATIONS):
+    """
+    Кластеризует маппинги (сигнатуры get_column_signature) по сходству Жаккара.
+    Маппинги перебираются от самых частых (weights: {сигнатура: число_вкладок}).
+    Каждый присоединяется к самому похожему представителю со сходством >= threshold,
+    иначе сам становится представителем нового кластера. Представители-кандидаты
+    берутся только из общих корзин LSH, поэтому попарного сравнения всех маппингов нет.
+    Возвращает: список [(представитель, [(сигнатура, сходство), ...]), ...];
+    представитель идёт первым в своём списке со сходством 1.0
+    """
+    weights = weights or {}
+    order = sorted(signatures, key=lambda signature: -weights.get(signature, 1))
+
+    hasher = MinHasher(num_perm)
+    bands, rows = _lsh_bands(threshold, num_perm)
+    buckets = {}
+    clusters = []  # [(представитель, множество_названий, участники)]
+
+    for signature in order:
+        names = set(signature)
+        minhash = hasher.signature(names)
+        keys = [(band, minhash[band * rows:(band + 1) * rows]) for band in range(bands)]
+
+        best = None
+        best_similarity = 0.0
+        checked = set()
+        for key in keys:
+            for cluster_idx in buckets.get(key, ()):
+                if cluster_idx in checked:
+                    continue
+                checked.add(cluster_idx)
+                similarity = jaccard_similarity(names, clusters[cluster_idx][1])
+                if similarity >= threshold and similarity > best_similarity:
+                    best, best_similarity = cluster_idx, similarity
+
+        if best is None:
+            clusters.append((signature, names, [(signature, 1.0)]))
+            for key in keys:
+                buckets.setdefault(key, []).append(len(clusters) - 1)
+        else:
+            clusters[best][2].append((signature, best_similarity))
+
+    return [(representative, members) for representative, _, members in clusters]
+
+
+# ====================================================================
+#          Компактное хранение заголовков для больших пакетов
+# ====================================================================
+# В пакете из сотен тысяч вкладок одни и те же названия столбцов
+# повторяются миллионы раз. Названия хранятся один раз в словаре,
+# вкладка хранит номера названий (array('I')) и 64-битный хэш сигнатуры,
+# так что группировка сводится к сравнению целых чисел. Одинаковые
+# наборы заголовков тоже хранятся один раз и общие для всех вкладок.
+
+# columns — номер первого столбца блока заголовков (блок всегда сплошной)
+CompactSheet = namedtuple("CompactSheet", ["name", "col_count", "header_row", "columns", "tokens", "signature"])
+
+
+class HeaderVocabulary:
+    """
+    Словарь названий столбцов: название -> номер и обратно, плюс общие
+    для всех вкладок наборы номеров. Можно использовать из нескольких потоков
+    """
+
+    def __init__(self):
+        self.names = []
+        self._ids = {}
+        self._layouts = {}  # кортеж номеров -> (array('I'), хэш_сигнатуры)
+        self._lock = threading.Lock()
+
+    def intern(self, name):
+        token = self._ids.get(name)
+        if token is None:
+            with self._lock:
+                token = self._ids.get(name)
+                if token is None:
+                    token = self._ids[name] = len(self.names)
+                    self.names.append(name)
+        return token
+
+    def layout(self, names):
+        """
+        Набор заголовков вкладки: (array('I') номеров названий, хэш сигнатуры).
+        Для одинаковых наборов возвращаются одни и те же объекты
+        """
+        key = tuple(self.intern(name) for name in names)
+        layout = self._layouts.get(key)
+        if layout is None:
+            signature = tuple(name.lower().strip() for name in names) if names else None
+            layout = self._layouts.setdefault(key, (array("I", key), signature_hash(signature)))
+        return layout
+
+    def __len__(self):
+        return len(self.names)
+
+
+def signature_hash(signature):
+    """64-битный хэш сигнатуры столбцов (get_column_signature) или None"""
+    if signature is None:
+        return None
+    digest = hashlib.blake2b("\0".join(signature).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def compact_sheet(sheet, vocabulary):
+    """(название_вкладки, количество_столбцов, заголовки, номер_строки) -> CompactSheet"""
+    sheet_name, col_count, headers, header_row = sheet
+    tokens, signature = vocabulary.layout([name for _, name in headers])
+
+    columns = [col_idx for col_idx, _ in headers]
+    if columns and columns != list(range(columns[0], columns[0] + len(columns))):
+        # Несплошной блок (не из find_header_row) храним целиком
+        columns = array("I", columns)
+    else:
+        columns = columns[0] if columns else 0
+
+    # Названия вкладок (Лист1, Sheet1, ...) тоже повторяются из файла в файл
+    return CompactSheet(sys.intern(sheet_name), col_count, header_row, columns, tokens, signature)
+
+
+def compact_structure(structure, vocabulary):
+    """Структура analyze_file_structure в компактном виде: [CompactSheet, ...]"""
+    return [compact_sheet(sheet, vocabulary) for sheet in structure]
+
+
+def expand_sheet(sheet, vocabulary):
+    """CompactSheet -> (название_вкладки, количество_столбцов, заголовки, номер_строки)"""
+    names = vocabulary.names
+    columns = sheet.columns
+    if isinstance(columns, int):
+        columns = range(columns, columns + len(sheet.tokens))
+    headers = [(col_idx, names[token]) for col_idx, token in zip(columns, sheet.tokens)]
+    return (sheet.name, sheet.col_count, headers, sheet.header_row)
+
+
+def expand_structure(sheets, vocabulary):
+    """Компактная структура -> список, как у analyze_file_structure"""
+    return [expand_sheet(sheet, vocabulary) for sheet in sheets]
+
+
+# ====================================================================
+#                 Маппинг по всем файлам пакета
+# ====================================================================
+class BatchMappingIndex:
+    """
+    Маппинг столбцов по всем вкладкам всех файлов пакета.
+    Файлы добавляются по мере готовности анализа; каждая вкладка попадает
+    в словарь {хэш_сигнатуры: {(путь, индекс_вкладки): None}}, поэтому
+    группировка линейна по общему числу вкладок, а повторное добавление
+    файла (после пересканирования) заменяет его прежние вкладки.
+    Вкладки хранятся компактно (CompactSheet) с общим словарём названий
+    """
+
+    def __init__(self, vocabulary=None):
+        self.vocabulary = vocabulary if vocabulary is not None else HeaderVocabulary()
+        self.groups = {}
+        self.structures = {}   # путь -> [CompactSheet, ...]
+        self.errors = {}       # путь -> строка с ошибкой
+        self._signatures = {}  # хэш -> сигнатура (по одной на различный маппинг)
+
+    def add_file(self, path, structure):
+        """Добавляет результат анализа файла (структуру или строку с ошибкой)"""
+        if isinstance(structure, str):
+            self.remove_file(path)
+            self.errors[path] = structure
+            return
+
+        self.add_compact(path, compact_structure(structure, self.vocabulary))
+
+    def add_compact(self, path, sheets):
+        """Добавляет уже сжатую структуру (словарь названий должен быть тем же)"""
+        self.remove_file(path)
+        self.structures[path] = sheets
+
+        for sheet_idx, sheet in enumerate(sheets):
+            if sheet.signature is None:
+                continue
+
+            members = self.groups.get(sheet.signature)
+            if members is None:
+                members = self.groups[sheet.signature] = {}
+                self._signatures[sheet.signature] = tuple(
+                    self.vocabulary.names[token].lower().strip() for token in sheet.tokens)
+            members[(path, sheet_idx)] = None
+
+    def remove_file(self, path):
+        self.errors.pop(path, None)
+        sheets = self.structures.pop(path, None)
+        if not sheets:
+            return
+
+        for sheet_idx, sheet in enumerate(sheets):
+            members = self.groups.get(sheet.signature)
+            if members is not None:
+                members.pop((path, sheet_idx), None)
+                if not members:
+                    del self.groups[sheet.signature]
+                    del self._signatures[sheet.signature]
+
+    def clear(self, vocabulary=None):
+        """
+        Убирает все файлы. vocabulary — новый словарь названий: его передают,
+        когда заводят новый словарь вместо прежнего (см. WorkbookRegistry.clear)
+        """
+        self.groups.clear()
+        self.structures.clear()
+        self.errors.clear()
+        self._signatures.clear()
+        if vocabulary is not None:
+            self.vocabulary = vocabulary
+
+    def snapshot(self):
+        """
+        Копия индекса на текущий момент (вкладки CompactSheet общие, они не меняются).
+        Снимается в потоке, который добавляет файлы (в GUI — в главном), чтобы
+        фоновые расчёты, например similar_clusters, не видели индекс в процессе изменения
+        """
+        copy = BatchMappingIndex(self.vocabulary)
+        copy.groups = {key: dict(members) for key, members in self.groups.items()}
+        copy.structures = dict(self.structures)
+        copy.errors = dict(self.errors)
+        copy._signatures = dict(self._signatures)
+        return copy
+
+    def sheet(self, path, sheet_idx):
+        """(название_вкладки, количество_столбцов, заголовки, номер_строки) вкладки"""
+        return expand_sheet(self.structures[path][sheet_idx], self.vocabulary)
+
+    def signature(self, key):
+        """Сигнатура столбцов (как get_column_signature) по хэшу из groups"""
+        return self._signatures[key]
+
+    def shared_groups(self):
+        """
+        Маппинги, общие для 2+ вкладок (в порядке первого появления)
+        Возвращает: список [(хэш_сигнатуры, [(путь, индекс_вкладки), ...]), ...]
+        """
+        return [(key, list(members)) for key, members in self.groups.items() if len(members) >= 2]
+
+    def unique_sheets(self):
+        """Вкладки с маппингом, который больше нигде не встречается: [(путь, индекс_вкладки), ...]"""
+        return [next(iter(members)) for members in self.groups.values() if len(members) == 1]
+
+    def similar_clusters(self, threshold=SIMILARITY_THRESHOLD):
+        """
+        Кластеры похожих маппингов (см. cluster_similar_signatures)
+        Возвращает: список [(представитель, [(сигнатура, сходство, [(путь, индекс_вкладки), ...]), ...]), ...]
+        """
+        keys = {self._signatures[key]: key for key in self.groups}
+        weights = {signature: len(self.groups[key]) for signature, key in keys.items()}
+        clusters = cluster_similar_signatures(list(keys), threshold, weights)
+        return [(representative, [(signature, similarity, list(self.groups[keys[signature]]))
+                                  for signature, similarity in members])
+                for representative, members in clusters]
+
+    def group_labels(self):
+        """Словарь {хэш_сигнатуры: 'Группа N'} для общих маппингов"""
+        return {key: f"Группа {num}" for num, (key, _) in enumerate(self.shared_groups(), 1)}
+
+    def iter_rows(self):
+        """
+        Строки для просмотра и экспорта: сначала вкладки общих маппингов по группам,
+        затем уникальные. Генератор: (путь, название_вкладки, количество_столбцов, группа)
+        """
+        for num, (_, members) in enumerate(self.shared_groups(), 1):
+            for path, sheet_idx in members:
+                sheet = self.structures[path][sheet_idx]
+                yield (path, sheet.name, sheet.col_count, f"Группа {num}")
+
+        for path, sheet_idx in self.unique_sheets():
+            sheet = self.structures[path][sheet_idx]
+            yield (path, sheet.name, sheet.col_count, "Уникальная")
+
+
+# ====================================================================
+#            Потоковая выгрузка полного анализа (NDJSON)
+# ====================================================================
+# Одна строка JSON на файл пишется сразу после его анализа, поэтому память
+# не зависит от размера пакета, а при падении посреди пакета уже
+# обработанные файлы остаются в выгрузке (и их можно пропустить при повторе).
+
+# Как часто (в записях) принудительно сбрасывать выгрузку на диск (fsync)
+NDJSON_FSYNC_EVERY = 100
+
+
+def structure_record(path, result):
+    """
+    Запись выгрузки по одному файлу: вкладки, строки и названия заголовков, группы маппинга.
+    result — {"structure": ..., "oversized": ...} (read_structure_payload) или строка с ошибкой.
+    Группа — 16 hex-цифр хэша сигнатуры: у одинаковых маппингов она одна в любом файле
+    """
+    if isinstance(result, str):
+        return {"file": path, "error": result}
+
+    sheets = []
+    for sheet_idx, (sheet_name, col_count, headers, header_row) in enumerate(result["structure"], 1):
+        key = signature_hash(get_column_signature(headers))
+        sheets.append({
+            "index": sheet_idx,
+            "name": sheet_name,
+            "header_row": header_row,
+            "columns": col_count,
+            "headers": [{"column": get_column_letter(col_idx), "name": name} for col_idx, name in headers],
+            "group": f"{key:016x}" if key is not None else None,
+        })
+
+    record = {"file": path, "sheets": sheets}
+    if result["oversized"]:
+        record["oversized"] = [{"sheet": name, "declared_cols": declared, "real_cols": real}
+                               for name, declared, real in result["oversized"]]
+    return record
+
+
+def read_exported_files(path):
+    """
+    Файлы, уже успешно записанные в выгрузку NDJSON (для продолжения после сбоя).
+    Оборванная последняя строка не учитывается. Файлы с записью об ошибке
+    не считаются выгруженными: при продолжении они анализируются снова,
+    и новая запись дописывается после старой (актуальна последняя)
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break
+            try:
+                record = json.loads(line)
+                if "error" in record:
+                    done.discard(record["file"])
+                else:
+                    done.add(record["file"])
+            except (ValueError, KeyError, TypeError):
+                continue
+    return done
+
+
+class NdjsonWriter:
+    """
+    Пишет по одной записи JSON на строку и сразу сбрасывает её из буфера.
+    append=True — дописывать в существующую выгрузку (оборванная последняя
+    строка при этом отрезается)
+    """
+
+    def __init__(self, path, append=False, fsync_every=NDJSON_FSYNC_EVERY):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.count = 0
+
+        if append and os.path.exists(path):
+            _truncate_partial_line(path)
+        self._file = open(path, "a" if append else "w", encoding="utf-8", newline="\n")
+
+    def write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self.count += 1
+        if self.fsync_every and self.count % self.fsync_every == 0:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if not self._file.closed:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _truncate_partial_line(path):
+    """Отрезает недописанную последнюю строку файла"""
+    with open(path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        pos = size
+        while pos > 0:
+            step = min(4096, pos)
+            f.seek(pos - step)
+            chunk = f.read(step)
+            newline = chunk.rfind(b"\n")
+            if newline != -1:
+                pos = pos - step + newline + 1
+                break
+            pos -= step
+        if pos != size:
+            f.truncate(pos)
+
+
+# ====================================================================
+#              Быстрая запись XLSX (потоковый режим openpyxl)
+# ====================================================================
+# Обычный Workbook() держит в памяти объект на каждую ячейку до wb.save.
+# В режиме write_only строки сразу сериализуются во временный файл листа,
+# поэтому выгрузка на сотни тысяч строк идёт с постоянной памятью.
+
+XLSX_SHEET_TITLE_MAX = 31
+_XLSX_TITLE_FORBIDDEN = str.maketrans({ch: "_" for ch in "[]:*?/\\"})
+
+
+def _xlsx_sheet_title(title, used):
+    """Допустимое и уникальное в книге название листа (до 31 символа, без []:*?/\\)"""
+    base = (str(title).translate(_XLSX_TITLE_FORBIDDEN).strip("'") or "Лист")[:XLSX_SHEET_TITLE_MAX]
+    candidate = base
+    num = 2
+    while candidate.lower() in used:
+        suffix = f" ({num})"
+        candidate = base[:XLSX_SHEET_TITLE_MAX - len(suffix)] + suffix
+        num += 1
+    used.add(candidate.lower())
+    return candidate
+
+
+def save_rows_to_xlsx(path, sheets, column_widths=None):
+    """
+    Записывает таблицы в XLSX в потоковом режиме (openpyxl write_only).
+    sheets — (название_листа, заголовок, строки) по листам; и sheets, и строки
+    могут быть генераторами: листы пишутся по очереди, строки не накапливаются
+    column_widths — ширины столбцов в символах (для всех листов) или None
+    """
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    used = set()
+
+    for title, header, rows in sheets:
+        ws = wb.create_sheet(_xlsx_sheet_title(title, used))
+
+        # В режиме write_only ширины задаются до первой строки
+        for col_idx, width in enumerate(column_widths or [], 1):
+            if width:
+                ws.column_dimensions[get_column_letter(col_idx)].width = width
+
+        ws.append(header)
+        for row in rows:
+            ws.append(row)
+
+    if not used:
+        wb.create_sheet("Лист")
+    wb.save(path)
+
+
+def split_rows_by_group(header, rows, group_col):
+    """
+    Генератор листов (группа, заголовок, строки группы) для save_rows_to_xlsx.
+    Строки одной группы должны идти подряд (как в BatchMappingIndex.iter_rows)
+    """
+    for group, group_rows in groupby(rows, key=itemgetter(group_col)):
+        yield group, header, group_rows
+
+
+# ====================================================================
+#              Параллельный подсчёт вкладок по многим файлам
+# ====================================================================
+# Число процессов по умолчанию (None — по числу ядер)
+COUNT_WORKERS = None
+
+# Сколько файлов отдавать процессу за одну задачу: мелкие файлы
+# считаются за миллисекунды, и пересылка по одному съедает выигрыш
+COUNT_CHUNK_SIZE = 16
+
+
+def _map_chunk(func, chunk):
+    """Применяет func к пачке [(индекс, путь), ...] внутри процесса-воркера"""
+    return [(idx, path, func(path)) for idx, path in chunk]
+
+
+def map_files_parallel(func, paths, workers=COUNT_WORKERS, chunk_size=COUNT_CHUNK_SIZE):
+    """
+    Применяет func(путь) ко всем файлам в пуле процессов.
+    func должна быть функцией верхнего уровня модуля (её передают в воркеры)
+    и сама перехватывать свои ошибки.
+    Генератор: выдаёт (номер_файла, путь, результат) по мере готовности,
+    номер — позиция файла в исходном списке (с 1).
+    Если упал сам воркер, результат для файлов его пачки — "Ошибка: ..."
+    """
+    indexed = list(enumerate(paths, 1))
+    workers = workers or os.cpu_count() or 1
+
+    # Для одного процесса или пары файлов пул только добавит накладные расходы
+    if workers <= 1 or len(indexed) <= 1:
+        for idx, path in indexed:
+            yield (idx, path, func(path))
+        return
+
+    chunks = [indexed[i:i + chunk_size] for i in range(0, len(indexed), chunk_size)]
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+        futures = {executor.submit(_map_chunk, func, chunk): chunk for chunk in chunks}
+
+        try:
+            for future in as_completed(futures):
+                try:
+                    chunk_results = future.result()
+                except Exception as e:
+                    # Упал сам воркер — помечаем ошибкой все файлы пачки
+                    chunk_results = [(idx, path, f"Ошибка: {e}") for idx, path in futures[future]]
+
+                for result in chunk_results:
+                    yield result
+        finally:
+            # Если потребитель прервал перебор, не ждём оставшиеся задачи
+            for future in futures:
+                future.cancel()
+
+
+def count_files_parallel(paths, workers=COUNT_WORKERS, chunk_size=COUNT_CHUNK_SIZE):
+    """
+    Считает вкладки во всех файлах в пуле процессов.
+    Генератор: (номер_файла, путь, число_вкладок или "Ошибка: ...")
+    """
+    return map_files_parallel(count_sheets_in_file, paths, workers, chunk_size)
+
+
+# ====================================================================
+#              Поиск Excel-файлов в папках (рекурсивно)
+# ====================================================================
+EXCEL_EXTENSIONS = (".xls", ".xlsx", ".xlsm")
+
+
+def is_excel_file_name(name):
+    """Excel-файл по расширению; временные файлы блокировки Excel (~$...) пропускаются"""
+    return name.lower().endswith(EXCEL_EXTENSIONS) and not name.startswith("~$")
+
+
+def iter_excel_files(root):
+    """
+    Обходит папку со всеми подпапками через os.scandir (итеративно, без рекурсии)
+    и выдаёт пути Excel-файлов по мере обнаружения.
+    Недоступные папки пропускаются
+    """
+    stack = [root]
+
+    while stack:
+        folder = stack.pop()
+        subdirs = []
+
+        try:
+            with os.scandir(folder) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif is_excel_file_name(entry.name) and entry.is_file():
+                    yield entry.path
+            except OSError:
+                continue
+
+        # Обратный порядок в стеке — подпапки обходятся по алфавиту
+        stack.extend(reversed(subdirs))
@@ -6,36 +6,15 @@ import sys
 import re
 import unicodedata
 
-# Excel библиотеки
-import xlrd  # для XLS
-from openpyxl import load_workbook  # для XLSX/XLSM
+import multiprocessing
+
+# Параллельный подсчёт вкладок и открытие книг с гарантированным закрытием (общие с tabcounter2)
+from tabcore import count_files_parallel, open_read_only_workbook, open_xls_book
 
 # Drag & Drop
 from tkinterdnd2 import TkinterDnD, DND_FILES
 
 
-# ====================================================================
-#                      Подсчёт вкладок Excel
-# ====================================================================
-def count_sheets_in_file(path):
-    ext = os.path.splitext(path)[1].lower()
-
-    try:
-        if ext in [".xlsx", ".xlsm"]:
-            wb = load_workbook(path, read_only=True)
-            return len(wb.sheetnames)
-
-        elif ext == ".xls":
-            wb = xlrd.open_workbook(path)
-            return len(wb.sheet_names())
-
-        else:
-            return "Неподдерживаемый формат"
-
-    except Exception as e:
-        return f"Ошибка: {e}"
-
-
 # ====================================================================
 #                   Получение списка вкладок с индексами
 # ====================================================================
@@ -45,12 +24,12 @@ def get_sheet_names(path):
     
     try:
         if ext in [".xlsx", ".xlsm"]:
-            wb = load_workbook(path, read_only=True)
-            return [(idx, name) for idx, name in enumerate(wb.sheetnames, 1)]
+            with open_read_only_workbook(path) as wb:
+                return [(idx, name) for idx, name in enumerate(wb.sheetnames, 1)]
 
         elif ext == ".xls":
-            wb = xlrd.open_workbook(path)
-            return [(idx, name) for idx, name in enumerate(wb.sheet_names(), 1)]
+            with open_xls_book(path) as wb:
+                return [(idx, name) for idx, name in enumerate(wb.sheet_names(), 1)]
 
         else:
             return []
@@ -140,27 +119,25 @@ def analyze_file_structure(path):
     
     try:
         if ext in [".xlsx", ".xlsm"]:
-            wb = load_workbook(path, read_only=True, data_only=True)
-            
-            for sheet_name in wb.sheetnames:
-                sheet = wb[sheet_name]
-                header_row, headers = find_header_row(sheet)
-                
-                if header_row:
-                    results.append((sheet_name, len(headers), headers, header_row))
-                else:
-                    results.append((sheet_name, 0, [], None))
+            with open_read_only_workbook(path, data_only=True) as wb:
+                for sheet_name in wb.sheetnames:
+                    sheet = wb[sheet_name]
+                    header_row, headers = find_header_row(sheet)
+                    
+                    if header_row:
+                        results.append((sheet_name, len(headers), headers, header_row))
+                    else:
+                        results.append((sheet_name, 0, [], None))
         
         elif ext == ".xls":
-            wb = xlrd.open_workbook(path)
-            
-            for sheet in wb.sheets():
-                header_row, headers = find_header_row_xls(sheet)
-                
-                if header_row:
-                    results.append((sheet.name, len(headers), headers, header_row))
-                else:
-                    results.append((sheet.name, 0, [], None))
+            with open_xls_book(path, on_demand=False) as wb:
+                for sheet in wb.sheets():
+                    header_row, headers = find_header_row_xls(sheet)
+                    
+                    if header_row:
+                        results.append((sheet.name, len(headers), headers, header_row))
+                    else:
+                        results.append((sheet.name, 0, [], None))
         
         return results
     
@@ -213,14 +190,16 @@ def count_all():
     results = []
     items = file_list.get_children()
     
-    for idx, path in enumerate(files, 1):
-        count = count_sheets_in_file(path)
+    # Файлы считаются в пуле процессов, результаты приходят по мере готовности
+    for idx, path, count in count_files_parallel(files):
         results.append((idx, os.path.basename(path), count))
         
         if idx - 1 < len(items):
             item_id = items[idx - 1]
             file_list.item(item_id, values=(idx, path, count))
+            file_list.update_idletasks()
 
+    results.sort(key=lambda r: r[0])
     show_results(results)
 
 
@@ -575,48 +554,52 @@ def drop(event):
 # ====================================================================
 #                              GUI
 # ====================================================================
-root = TkinterDnD.Tk()
-root.title("Excel Sheet Counter PRO")
-root.geometry("750x550")
-root.resizable(False, False)
+if __name__ == "__main__":
+    # Нужен для процессов-воркеров в собранном exe (Windows)
+    multiprocessing.freeze_support()
 
-if sys.platform == "win32":
-    try:
-        sys.stdout.reconfigure(encoding='utf-8')
-    except:
-        pass
+    root = TkinterDnD.Tk()
+    root.title("Excel Sheet Counter PRO")
+    root.geometry("750x550")
+    root.resizable(False, False)
+
+    if sys.platform == "win32":
+        try:
+            sys.stdout.reconfigure(encoding='utf-8')
+        except:
+            pass
 
-main = tk.Frame(root, padx=10, pady=10)
-main.pack(fill="both", expand=True)
+    main = tk.Frame(root, padx=10, pady=10)
+    main.pack(fill="both", expand=True)
 
-tk.Label(main, text="Перетащите Excel-файлы сюда или нажмите 'Добавить файлы'").pack()
+    tk.Label(main, text="Перетащите Excel-файлы сюда или нажмите 'Добавить файлы'").pack()
 
-file_list = ttk.Treeview(main, columns=("num", "path", "count"), show="headings", height=12)
-file_list.heading("num", text="№")
-file_list.heading("path", text="Путь к файлу")
-file_list.heading("count", text="Вкладок")
-file_list.column("num", width=40, anchor="center")
-file_list.column("path", width=580)
-file_list.column("count", width=80, anchor="center")
-file_list.pack(fill="both", expand=True, pady=10)
+    file_list = ttk.Treeview(main, columns=("num", "path", "count"), show="headings", height=12)
+    file_list.heading("num", text="№")
+    file_list.heading("path", text="Путь к файлу")
+    file_list.heading("count", text="Вкладок")
+    file_list.column("num", width=40, anchor="center")
+    file_list.column("path", width=580)
+    file_list.column("count", width=80, anchor="center")
+    file_list.pack(fill="both", expand=True, pady=10)
 
-file_list.drop_target_register(DND_FILES)
-file_list.dnd_bind("<<Drop>>", drop)
+    file_list.drop_target_register(DND_FILES)
+    file_list.dnd_bind("<<Drop>>", drop)
 
-btns = tk.Frame(main)
-btns.pack()
+    btns = tk.Frame(main)
+    btns.pack()
 
-tk.Button(btns, text="Добавить файлы", width=18, command=add_files).grid(row=0, column=0, padx=5)
-tk.Button(btns, text="Очистить список", width=18, command=clear_list).grid(row=0, column=1, padx=5)
-tk.Button(btns, text="Подсчитать вкладки", width=18, command=count_all).grid(row=0, column=2, padx=5)
+    tk.Button(btns, text="Добавить файлы", width=18, command=add_files).grid(row=0, column=0, padx=5)
+    tk.Button(btns, text="Очистить список", width=18, command=clear_list).grid(row=0, column=1, padx=5)
+    tk.Button(btns, text="Подсчитать вкладки", width=18, command=count_all).grid(row=0, column=2, padx=5)
 
-btns2 = tk.Frame(main)
-btns2.pack(pady=5)
+    btns2 = tk.Frame(main)
+    btns2.pack(pady=5)
 
-tk.Button(btns2, text="Показать вкладки выбранного файла", width=40, 
-          command=show_sheets, bg="#4CAF50", fg="white", font=("Arial", 9, "bold")).grid(row=0, column=0, padx=5)
+    tk.Button(btns2, text="Показать вкладки выбранного файла", width=40, 
+              command=show_sheets, bg="#4CAF50", fg="white", font=("Arial", 9, "bold")).grid(row=0, column=0, padx=5)
 
-tk.Button(btns2, text="Показать все столбцы файла", width=40, 
-          command=show_columns, bg="#2196F3", fg="white", font=("Arial", 9, "bold")).grid(row=0, column=1, padx=5)
+    tk.Button(btns2, text="Показать все столбцы файла", width=40, 
+              command=show_columns, bg="#2196F3", fg="white", font=("Arial", 9, "bold")).grid(row=0, column=1, padx=5)
 
-root.mainloop()
\ No newline at end of file
+    root.mainloop()
\ No newline at end of file
@@ -5,236 +5,311 @@ import csv
 import sys
 import re
 import unicodedata
-
-# Excel библиотеки
-import xlrd  # для XLS
-from openpyxl import load_workbook  # для XLSX/XLSM
+import multiprocessing
+import threading
+import queue
+import time
+
+# Чтение и анализ Excel (без GUI, используется и в процессах-воркерах)
+from tabcore import (
+    get_column_letter,
+    get_column_signature,
+    iter_excel_files,
+    is_excel_file_name,
+    BatchMappingIndex,
+    diff_signatures,
+    SIMILARITY_THRESHOLD,
+    structure_record,
+    NdjsonWriter,
+    save_rows_to_xlsx,
+    split_rows_by_group,
+)
+
+# Постоянный кэш и модель книги: каждый файл разбирается один раз за сессию
+from tabcache import AnalysisCache, WorkbookRegistry
 
 # Drag & Drop
 from tkinterdnd2 import TkinterDnD, DND_FILES
 
 
 # ====================================================================
-#                      Подсчёт вкладок Excel
+#                      Цвета групп маппинга
 # ====================================================================
-def count_sheets_in_file(path):
-    ext = os.path.splitext(path)[1].lower()
+def get_group_colors():
+    """
+    Возвращает список цветов для групп вкладок
+    """
+    return [
+        "#C8E6C9",  # Светло-зелёный
+        "#E1BEE7",  # Лиловый
+        "#FFCCBC",  # Светло-оранжевый
+        "#B3E5FC",  # Светло-голубой
+        "#FFF9C4",  # Светло-жёлтый
+        "#F8BBD0",  # Светло-розовый
+        "#D1C4E9",  # Светло-фиолетовый
+        "#DCEDC8",  # Светло-салатовый
+        "#FFECB3",  # Светло-янтарный
+        "#CFD8DC",  # Светло-серый
+    ]
 
-    try:
-        if ext in [".xlsx", ".xlsm"]:
-            wb = load_workbook(path, read_only=True)
-            return len(wb.sheetnames)
 
-        elif ext == ".xls":
-            wb = xlrd.open_workbook(path)
-            return len(wb.sheet_names())
+# ====================================================================
+#              Фоновые задачи: окно не зависает во время анализа
+# ====================================================================
+# Как часто GUI забирает события из очереди фоновой задачи
+POLL_INTERVAL_MS = 100
 
-        else:
-            return "Неподдерживаемый формат"
+# Сколько секунд за один опрос тратить на события, чтобы не подвешивать окно
+POLL_TIME_BUDGET = 0.05
 
-    except Exception as e:
-        return f"Ошибка: {e}"
 
+def run_in_background(title, work, on_done, total=0, on_item=None):
+    """
+    Запускает work(post, cancel) в фоновом потоке с окном прогресса и кнопкой «Отмена».
+    work передаёт промежуточные результаты через post(item) и должен
+    периодически проверять cancel.is_set().
+    on_item(item) и on_done(result) вызываются в потоке GUI (через root.after);
+    on_done не вызывается, если задача отменена.
+    total — число шагов для шкалы прогресса (0 — неопределённый прогресс)
+    """
+    events = queue.Queue()
+    cancel = threading.Event()
+    state = {"done": 0}
 
-# ====================================================================
-#                   Получение списка вкладок с индексами
-# ====================================================================
-def get_sheet_names(path):
-    """Возвращает список кортежей (индекс, название вкладки)"""
-    ext = os.path.splitext(path)[1].lower()
-    
-    try:
-        if ext in [".xlsx", ".xlsm"]:
-            wb = load_workbook(path, read_only=True)
-            return [(idx, name) for idx, name in enumerate(wb.sheetnames, 1)]
+    win = tk.Toplevel(root)
+    win.title(title)
+    win.geometry("400x130")
+    win.resizable(False, False)
+    win.transient(root)
 
-        elif ext == ".xls":
-            wb = xlrd.open_workbook(path)
-            return [(idx, name) for idx, name in enumerate(wb.sheet_names(), 1)]
+    status = tk.Label(win, text="Подготовка...")
+    status.pack(pady=(15, 5))
 
-        else:
-            return []
+    if total:
+        bar = ttk.Progressbar(win, length=350, mode="determinate", maximum=total)
+    else:
+        bar = ttk.Progressbar(win, length=350, mode="indeterminate")
+        bar.start(15)
+    bar.pack(pady=5)
 
-    except Exception as e:
-        return []
+    def cancel_task():
+        cancel.set()
+        status.config(text="Отмена...")
 
+    tk.Button(win, text="Отмена", width=15, command=cancel_task).pack(pady=5)
+    win.protocol("WM_DELETE_WINDOW", cancel_task)
 
-# ====================================================================
-#                   Анализ столбцов и заголовков
-# ====================================================================
-def find_header_row(sheet, max_rows=50):
-    """
-    Ищет строку с заголовками (как минимум 4 заполненных ячейки подряд)
-    Возвращает: (номер_строки, список_заголовков) или (None, [])
-    """
-    for row_idx in range(1, min(max_rows + 1, sheet.max_row + 1)):
-        row_cells = []
-        consecutive_filled = 0
-        start_col = None
-        
-        # Проходим по всем колонкам в строке
-        for col_idx in range(1, sheet.max_column + 1):
-            cell = sheet.cell(row=row_idx, column=col_idx)
-            value = cell.value
-            
-            if value is not None and str(value).strip():
-                if start_col is None:
-                    start_col = col_idx
-                consecutive_filled += 1
-                row_cells.append((col_idx, str(value).strip()))
-            else:
-                # Если был блок заполненных ячеек >= 4, это заголовок
-                if consecutive_filled >= 4:
-                    return (row_idx, row_cells)
-                # Сброс счётчика
-                consecutive_filled = 0
-                row_cells = []
-                start_col = None
-        
-        # Проверка в конце строки
-        if consecutive_filled >= 4:
-            return (row_idx, row_cells)
-    
-    return (None, [])
-
-
-def find_header_row_xls(sheet, max_rows=50):
-    """
-    Ищет строку с заголовками для XLS файлов
-    Возвращает: (номер_строки, список_заголовков) или (None, [])
-    """
-    for row_idx in range(min(max_rows, sheet.nrows)):
-        row_cells = []
-        consecutive_filled = 0
-        start_col = None
-        
-        for col_idx in range(sheet.ncols):
-            cell = sheet.cell(row_idx, col_idx)
-            value = cell.value
-            
-            if value is not None and str(value).strip():
-                if start_col is None:
-                    start_col = col_idx
-                consecutive_filled += 1
-                row_cells.append((col_idx + 1, str(value).strip()))
-            else:
-                if consecutive_filled >= 4:
-                    return (row_idx + 1, row_cells)
-                consecutive_filled = 0
-                row_cells = []
-                start_col = None
-        
-        if consecutive_filled >= 4:
-            return (row_idx + 1, row_cells)
-    
-    return (None, [])
+    def worker():
+        try:
+            result = work(lambda item: events.put(("item", item)), cancel)
+            events.put(("done", result))
+        except Exception as e:
+            events.put(("error", e))
 
+    def poll():
+        deadline = time.monotonic() + POLL_TIME_BUDGET
+        while time.monotonic() < deadline:
+            try:
+                kind, payload = events.get_nowait()
+            except queue.Empty:
+                break
 
-def analyze_file_structure(path):
-    """
-    Анализирует структуру файла: для каждой вкладки находит заголовки
-    Возвращает: список [(название_вкладки, количество_столбцов, список_заголовков, номер_строки), ...]
-    """
-    ext = os.path.splitext(path)[1].lower()
-    results = []
-    
-    try:
-        if ext in [".xlsx", ".xlsm"]:
-            wb = load_workbook(path, read_only=True, data_only=True)
-            
-            for sheet_name in wb.sheetnames:
-                sheet = wb[sheet_name]
-                header_row, headers = find_header_row(sheet)
-                
-                if header_row:
-                    results.append((sheet_name, len(headers), headers, header_row))
-                else:
-                    results.append((sheet_name, 0, [], None))
-        
-        elif ext == ".xls":
-            wb = xlrd.open_workbook(path)
-            
-            for sheet in wb.sheets():
-                header_row, headers = find_header_row_xls(sheet)
-                
-                if header_row:
-                    results.append((sheet.name, len(headers), headers, header_row))
-                else:
-                    results.append((sheet.name, 0, [], None))
-        
-        return results
-    
-    except Exception as e:
-        print(f"Ошибка анализа файла: {e}")
-        return []
+            if kind == "item":
+                state["done"] += 1
+                if total:
+                    bar["value"] = state["done"]
+                    status.config(text=f"Обработано файлов: {state['done']} из {total}")
+                if on_item:
+                    on_item(payload)
+                continue
+
+            win.destroy()
+            if kind == "error":
+                messagebox.showerror("Ошибка", str(payload))
+            elif not cancel.is_set():
+                on_done(payload)
+            return
 
+        root.after(POLL_INTERVAL_MS, poll)
 
-def get_column_letter(col_num):
-    """Конвертирует номер колонки в буквенное обозначение Excel (1 -> A, 27 -> AA)"""
-    result = ""
-    while col_num > 0:
-        col_num -= 1
-        result = chr(65 + (col_num % 26)) + result
-        col_num //= 26
-    return result
+    threading.Thread(target=worker, daemon=True).start()
+    root.after(POLL_INTERVAL_MS, poll)
 
 
 # ====================================================================
-#                   Сравнение маппинга столбцов
+#          Виртуальный список файлов (быстрый и на 100k строк)
 # ====================================================================
-def get_column_signature(headers):
+class VirtualFileList:
     """
-    Создаёт сигнатуру столбцов для сравнения (только названия, без индексов)
+    Список файлов, который не замедляется на сотнях тысяч строк.
+    Данные хранятся в списке путей и словаре результатов, а Treeview
+    содержит только видимые строки: при прокрутке подменяются их значения
     """
-    if not headers:
-        return None
-    # Берём только названия столбцов (игнорируем их позиции)
-    return tuple(name.lower().strip() for idx, name in headers)
 
+    def __init__(self, parent, paths, rows=10):
+        self.paths = paths
+        self.counts = {}  # номер файла (с 0) -> результат подсчёта
+        self.rows = rows
+        self.offset = 0
+        self.selected = None
+        self._refresh_pending = False
+
+        self.frame = tk.Frame(parent)
+        self.tree = ttk.Treeview(self.frame, columns=("num", "path", "count"), show="headings",
+                                 height=rows, selectmode="browse")
+        self.tree.heading("num", text="№")
+        self.tree.heading("path", text="Путь к файлу")
+        self.tree.heading("count", text="Вкладок")
+        self.tree.column("num", width=50, anchor="center")
+        self.tree.column("path", width=560)
+        self.tree.column("count", width=80, anchor="center")
+
+        self.scroll = ttk.Scrollbar(self.frame, orient="vertical", command=self._on_scrollbar)
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.scroll.pack(side="right", fill="y")
+
+        # Строки Treeview, в которые выводится видимое окно списка
+        self.items = []
+
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        self.tree.bind("<MouseWheel>", self._on_wheel)
+        self.tree.bind("<Button-4>", lambda e: self.scroll_by(-3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll_by(3))
+        self.tree.bind("<Up>", lambda e: self._move_selection(-1))
+        self.tree.bind("<Down>", lambda e: self._move_selection(1))
+        self.tree.bind("<Prior>", lambda e: self._move_selection(-self.rows))
+        self.tree.bind("<Next>", lambda e: self._move_selection(self.rows))
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    # ---------------------- Изменение данных ----------------------
+    def refresh(self):
+        """Перерисовывает видимое окно (несколько вызовов подряд объединяются)"""
+        if not self._refresh_pending:
+            self._refresh_pending = True
+            self.tree.after_idle(self._refresh)
+
+    def reset(self):
+        """Сбрасывает результаты и прокрутку после очистки списка путей"""
+        self.counts.clear()
+        self.offset = 0
+        self.selected = None
+        self.refresh()
+
+    def set_count(self, index, path, count):
+        """Записывает результат файла; обновляет строку, только если она видна"""
+        # Список могли очистить или заполнить заново, пока шёл подсчёт
+        if index >= len(self.paths) or self.paths[index] != path:
+            return
 
-def group_sheets_by_mapping(structure):
-    """
-    Группирует вкладки по одинаковому маппингу столбцов
-    Возвращает: словарь {signature: [список_индексов_вкладок]}
-    """
-    mapping_groups = {}
-    
-    for idx, (sheet_name, col_count, headers, header_row) in enumerate(structure):
-        signature = get_column_signature(headers)
-        
-        if signature is None:
-            continue
-        
-        if signature not in mapping_groups:
-            mapping_groups[signature] = []
-        
-        mapping_groups[signature].append(idx)
-    
-    return mapping_groups
+        self.counts[index] = count
+        pos = index - self.offset
+        if 0 <= pos < len(self.items):
+            self.tree.item(self.items[pos], values=(index + 1, path, count))
+
+    def selected_path(self):
+        if self.selected is None or self.selected >= len(self.paths):
+            return None
+        return self.paths[self.selected]
+
+    # ------------------------- Отрисовка --------------------------
+    def _refresh(self):
+        self._refresh_pending = False
+        total = len(self.paths)
+        self.offset = max(0, min(self.offset, total - self.rows))
+        visible = min(self.rows, total - self.offset)
+
+        while len(self.items) < visible:
+            self.items.append(self.tree.insert("", tk.END, values=("", "", "")))
+        while len(self.items) > visible:
+            self.tree.delete(self.items.pop())
+
+        for pos, item_id in enumerate(self.items):
+            index = self.offset + pos
+            self.tree.item(item_id, values=(index + 1, self.paths[index], self.counts.get(index, "")))
+
+        pos = None if self.selected is None else self.selected - self.offset
+        if pos is not None and 0 <= pos < len(self.items):
+            self.tree.selection_set(self.items[pos])
+        else:
+            self.tree.selection_set(())
 
+        if total:
+            self.scroll.set(self.offset / total, (self.offset + visible) / total)
+        else:
+            self.scroll.set(0, 1)
+
+    # ------------------------- Прокрутка --------------------------
+    def scroll_by(self, delta):
+        self.offset += delta
+        self.refresh()
+        return "break"
+
+    def _on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self.offset = int(float(value) * len(self.paths))
+        elif unit == "pages":
+            self.offset += int(value) * self.rows
+        else:
+            self.offset += int(value)
+        self.refresh()
 
-def get_group_colors():
-    """
-    Возвращает список цветов для групп вкладок
-    """
-    return [
-        "#C8E6C9",  # Светло-зелёный
-        "#E1BEE7",  # Лиловый
-        "#FFCCBC",  # Светло-оранжевый
-        "#B3E5FC",  # Светло-голубой
-        "#FFF9C4",  # Светло-жёлтый
-        "#F8BBD0",  # Светло-розовый
-        "#D1C4E9",  # Светло-фиолетовый
-        "#DCEDC8",  # Светло-салатовый
-        "#FFECB3",  # Светло-янтарный
-        "#CFD8DC",  # Светло-серый
-    ]
+    def _on_wheel(self, event):
+        # Windows: delta кратно 120, macOS: небольшие значения
+        step = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        return self.scroll_by(-3 * step)
+
+    def _on_select(self, event):
+        # Пока окно не перерисовано, позиции строк не соответствуют offset
+        if self._refresh_pending:
+            return
+
+        selection = self.tree.selection()
+        # Пустой выбор — это строка ушла из видимого окна, а не отмена выбора
+        if selection and selection[0] in self.items:
+            self.selected = self.offset + self.items.index(selection[0])
+
+    def _move_selection(self, delta):
+        if not self.paths:
+            return "break"
+
+        current = self.selected if self.selected is not None else self.offset
+        self.selected = max(0, min(current + delta, len(self.paths) - 1))
+
+        # Прокручиваем так, чтобы выбранная строка была видна
+        if self.selected < self.offset:
+            self.offset = self.selected
+        elif self.selected >= self.offset + self.rows:
+            self.offset = self.selected - self.rows + 1
+        self.refresh()
+        return "break"
 
 
 # ====================================================================
 #                        Управление списком файлов
 # ====================================================================
 files = []
+# Нормализованные пути уже добавленных файлов: проверка повтора за O(1)
+files_seen = set()
+
+# По сколько найденных файлов передавать в список при обходе папок
+DISCOVERY_BATCH_SIZE = 200
+
+
+def add_paths(paths):
+    """Добавляет файлы в список, пропуская повторы. Возвращает число добавленных"""
+    added = 0
+    for path in paths:
+        key = os.path.normcase(os.path.normpath(path))
+        if key not in files_seen:
+            files_seen.add(key)
+            files.append(path)
+            added += 1
+
+    if added:
+        file_list.refresh()
+    return added
 
 
 def add_files():
@@ -242,16 +317,50 @@ def add_files():
         title="Выберите Excel файлы",
         filetypes=[("Excel files", "*.xlsx *.xlsm *.xls")]
     )
-    for path in file_paths:
-        if path not in files:
-            files.append(path)
-            file_list.insert("", tk.END, values=(len(files), path, ""))
+    add_paths(file_paths)
+
+
+def add_folder():
+    folder = filedialog.askdirectory(title="Выберите папку с Excel файлами")
+    if folder:
+        add_folders([folder])
+
+
+def add_folders(folders):
+    """
+    Рекурсивно ищет Excel-файлы в папках в фоновом потоке;
+    найденные файлы появляются в списке пачками, пока обход ещё идёт
+    """
+    state = {"added": 0}
+
+    def work(post, cancel):
+        batch = []
+        for folder in folders:
+            for path in iter_excel_files(folder):
+                if cancel.is_set():
+                    return
+                batch.append(path)
+                if len(batch) >= DISCOVERY_BATCH_SIZE:
+                    post(batch)
+                    batch = []
+        if batch:
+            post(batch)
+
+    def on_item(batch):
+        state["added"] += add_paths(batch)
+
+    def on_done(_):
+        messagebox.showinfo("Результат", f"✅ Добавлено файлов из папок: {state['added']}")
+
+    run_in_background("Поиск Excel-файлов в папках", work, on_done, on_item=on_item)
 
 
 def clear_list():
     files.clear()
-    for row in file_list.get_children():
-        file_list.delete(row)
+    files_seen.clear()
+    workbooks.clear()
+    mapping_index.clear(workbooks.vocabulary)
+    file_list.reset()
 
 
 # ====================================================================
@@ -262,34 +371,47 @@ def count_all():
         messagebox.showwarning("Ошибка", "Добавьте хотя бы один файл.")
         return
 
+    paths = list(files)
+    force = force_rescan.get()
     results = []
-    items = file_list.get_children()
-    
-    for idx, path in enumerate(files, 1):
-        count = count_sheets_in_file(path)
+
+    def work(post, cancel):
+        # Уже прочитанные и закэшированные файлы приходят сразу,
+        # остальные читаются в пуле процессов
+        scanner = workbooks.scan_sheets(paths, force=force)
+        try:
+            for idx, info in scanner:
+                if cancel.is_set():
+                    break
+                post((idx, info.path, info.get_sheet_count()))
+        finally:
+            scanner.close()
+
+    def on_item(result):
+        idx, path, count = result
         results.append((idx, os.path.basename(path), count))
-        
-        if idx - 1 < len(items):
-            item_id = items[idx - 1]
-            file_list.item(item_id, values=(idx, path, count))
+        file_list.set_count(idx - 1, path, count)
 
-    show_results(results)
+    def on_done(_):
+        # Возвращаем исходную нумерацию файлов
+        results.sort(key=lambda r: r[0])
+        show_results(results)
+
+    run_in_background("Подсчёт вкладок", work, on_done, total=len(paths), on_item=on_item)
 
 
 # ====================================================================
 #                      Показать вкладки выбранного файла
 # ====================================================================
 def show_sheets():
-    selected = file_list.selection()
-    if not selected:
+    file_path = file_list.selected_path()
+    if not file_path:
         messagebox.showwarning("Ошибка", "Выберите файл из списка.")
         return
     
-    item_values = file_list.item(selected[0], 'values')
-    file_path = item_values[1]
     file_name = os.path.basename(file_path)
     
-    sheets = get_sheet_names(file_path)
+    sheets = workbooks.get(file_path).get_sheets(force=force_rescan.get())
     
     if not sheets:
         messagebox.showerror("Ошибка", "Не удалось прочитать вкладки из файла.")
@@ -346,18 +468,24 @@ def show_sheets():
 #              Показать все столбцы файла
 # ====================================================================
 def show_columns():
-    selected = file_list.selection()
-    if not selected:
+    file_path = file_list.selected_path()
+    if not file_path:
         messagebox.showwarning("Ошибка", "Выберите файл из списка.")
         return
     
-    item_values = file_list.item(selected[0], 'values')
-    file_path = item_values[1]
     file_name = os.path.basename(file_path)
     
-    messagebox.showinfo("Анализ", "Анализирую структуру файла...\nЭто может занять несколько секунд.")
-    structure = analyze_file_structure(file_path)
-    
+    info = workbooks.get(file_path)
+    force = force_rescan.get()
+
+    def work(post, cancel):
+        return info.get_structure(force=force)
+
+    run_in_background(f"Анализ структуры: {file_name}", work,
+                      lambda structure: show_columns_window(file_name, structure, info.oversized))
+
+
+def show_columns_window(file_name, structure, oversized):
     if not structure:
         messagebox.showerror("Ошибка", "Не удалось проанализировать структуру файла.")
         return
@@ -369,6 +497,12 @@ def show_columns():
     tk.Label(win, text=f"Файл: {file_name}", font=("Arial", 10, "bold")).pack(pady=10)
     tk.Label(win, text=f"Найдено вкладок: {len(structure)}").pack()
     
+    if oversized:
+        # Вкладки, у которых <dimension> сильно больше реальных данных
+        details = ", ".join([f"{name} ({declared} → {real})" for name, declared, real in oversized])
+        tk.Label(win, text=f"⚠️ Завышенный размер листа (столбцов заявлено → реально): {details}",
+                 fg="#E65100", wraplength=650).pack()
+    
     table = ttk.Treeview(win, columns=("sheet", "columns", "header_row"), show="headings", height=12)
     table.heading("sheet", text="Название вкладки")
     table.heading("columns", text="Столбцов")
@@ -458,25 +592,29 @@ def show_columns():
 #         НОВАЯ ФУНКЦИЯ: Сравнить маппинг столбцов вкладок
 # ====================================================================
 def compare_sheet_mappings():
-    selected = file_list.selection()
-    if not selected:
+    file_path = file_list.selected_path()
+    if not file_path:
         messagebox.showwarning("Ошибка", "Выберите файл из списка.")
         return
     
-    item_values = file_list.item(selected[0], 'values')
-    file_path = item_values[1]
     file_name = os.path.basename(file_path)
     
-    messagebox.showinfo("Анализ", "Анализирую и сравниваю маппинг столбцов...\nЭто может занять несколько секунд.")
-    structure = analyze_file_structure(file_path)
-    
+    info = workbooks.get(file_path)
+    force = force_rescan.get()
+
+    def work(post, cancel):
+        # Группы маппинга считаются один раз и хранятся вместе со структурой
+        return info.get_structure(force=force), info.get_mapping_groups()
+
+    run_in_background(f"Сравнение маппинга: {file_name}", work,
+                      lambda result: show_mappings_window(file_name, *result))
+
+
+def show_mappings_window(file_name, structure, mapping_groups):
     if not structure:
         messagebox.showerror("Ошибка", "Не удалось проанализировать структуру файла.")
         return
     
-    # Группируем вкладки по маппингу
-    mapping_groups = group_sheets_by_mapping(structure)
-    
     # Фильтруем: оставляем только группы с 2+ вкладками
     filtered_groups = {sig: indices for sig, indices in mapping_groups.items() if len(indices) >= 2}
     
@@ -658,6 +796,415 @@ def compare_sheet_mappings():
     tk.Button(btn_frame, text="Экспортировать всё в CSV", width=30,
               command=export_all_mappings, bg="#2196F3", fg="white", font=("Arial", 9, "bold")).grid(row=0, column=1, padx=5)
 
+    def iter_mapping_rows():
+        for group_num, sheet_indices in enumerate(filtered_groups.values(), 1):
+            for sheet_idx in sheet_indices:
+                sheet_name, col_count, _, _ = structure[sheet_idx]
+                yield [sheet_name, col_count, f"Группа {group_num}"]
+
+        for sheet_idx in unique_indices:
+            sheet_name, col_count, _, _ = structure[sheet_idx]
+            yield [sheet_name, col_count, "Уникальная"]
+
+    add_xlsx_export_controls(btn_frame, 2, f"{os.path.splitext(file_name)[0]}_mappings.xlsx",
+                             ["Название вкладки", "Количество столбцов", "Группа"],
+                             iter_mapping_rows, [40, 22, 16])
+
+    # Похожие маппинги внутри файла: вкладки с отличием в несколько столбцов
+    file_index = BatchMappingIndex()
+    file_index.add_file(file_name, structure)
+    add_similarity_controls(btn_frame, 1, file_index)
+
+
+# ====================================================================
+#            Сравнить маппинг столбцов по всем файлам списка
+# ====================================================================
+# Индекс (mapping_index) пополняется по мере анализа файлов и живёт до очистки
+# списка; уже проанализированные файлы берутся из моделей книг без повторного
+# чтения, а сжатые заголовки — без копирования (общий словарь названий)
+
+
+def describe_columns(headers, limit=3):
+    """Краткое описание маппинга: первые столбцы и сколько ещё"""
+    text = ", ".join([name[:20] + "..." if len(name) > 20 else name for _, name in headers[:limit]])
+    if len(headers) > limit:
+        text += f" (+{len(headers) - limit} ещё)"
+    return text
+
+
+def compare_all_mappings():
+    if not files:
+        messagebox.showwarning("Ошибка", "Добавьте хотя бы один файл.")
+        return
+
+    paths = list(files)
+    force = force_rescan.get()
+    vocabulary = mapping_index.vocabulary
+
+    def work(post, cancel):
+        scanner = workbooks.scan_structures(paths, force=force)
+        try:
+            for idx, info, error in scanner:
+                if cancel.is_set():
+                    break
+                post((info.path, error or info.get_compact_structure()))
+        finally:
+            scanner.close()
+
+    def on_item(result):
+        if mapping_index.vocabulary is not vocabulary:
+            # Список очищен во время анализа: номера названий от прежнего словаря
+            return
+        path, structure = result
+        if isinstance(structure, str):
+            mapping_index.add_file(path, structure)
+        else:
+            mapping_index.add_compact(path, structure)
+
+    run_in_background("Сравнение маппинга всех файлов", work,
+                      lambda _: show_batch_mappings_window(mapping_index),
+                      total=len(paths), on_item=on_item)
+
+
+def show_batch_mappings_window(index):
+    shared_groups = index.shared_groups()
+    unique_sheets = index.unique_sheets()
+
+    if not shared_groups and not unique_sheets:
+        messagebox.showerror("Ошибка", "Ни в одном файле не найдены заголовки столбцов.")
+        return
+
+    win = tk.Toplevel(root)
+    win.title("Сравнение маппинга столбцов по всем файлам")
+    win.geometry("900x600")
+
+    tk.Label(win, text=f"Файлов: {len(index.structures)} | С ошибками: {len(index.errors)}",
+             font=("Arial", 10, "bold")).pack(pady=10)
+    tk.Label(win, text=f"Общих маппингов: {len(shared_groups)} | Уникальных вкладок: {len(unique_sheets)}").pack()
+
+    colors = get_group_colors()
+
+    # Группы — строки верхнего уровня; вкладки группы добавляются при раскрытии,
+    # чтобы окно на тысячах файлов открывалось сразу
+    table = ttk.Treeview(win, columns=("files", "sheets", "columns"), show="tree headings", height=18)
+    table.heading("#0", text="Группа / Файл и вкладка")
+    table.heading("files", text="Файлов")
+    table.heading("sheets", text="Вкладок")
+    table.heading("columns", text="Столбцов")
+    table.column("#0", width=560)
+    table.column("files", width=90, anchor="center")
+    table.column("sheets", width=90, anchor="center")
+    table.column("columns", width=90, anchor="center")
+    table.pack(fill="both", expand=True, padx=10, pady=10)
+
+    members_of = {}    # строка группы -> [(путь, индекс_вкладки), ...]
+    not_filled = set() # группы, вкладки которых ещё не добавлены
+    sheet_of = {}      # строка вкладки -> (путь, индекс_вкладки)
+
+    def add_group(text, members, tag):
+        headers = index.sheet(*members[0])[2]
+        file_count = len({path for path, _ in members})
+        item = table.insert("", tk.END, text=text, tags=tag,
+                            values=(file_count, len(members), len(headers) if tag else ""))
+        table.insert(item, tk.END, text="...")
+        members_of[item] = members
+        not_filled.add(item)
+
+    for num, (signature, members) in enumerate(shared_groups, 1):
+        tag = f"group_{num}"
+        table.tag_configure(tag, background=colors[(num - 1) % len(colors)])
+        headers = index.sheet(*members[0])[2]
+        add_group(f"Группа {num}: {describe_columns(headers)}", members, tag)
+
+    if unique_sheets:
+        add_group("Уникальные вкладки", unique_sheets, "")
+
+    def on_open(event):
+        item = table.focus()
+        if item not in not_filled:
+            return
+        not_filled.discard(item)
+        table.delete(*table.get_children(item))
+
+        tags = table.item(item, "tags")
+        for path, sheet_idx in members_of[item]:
+            sheet_name, col_count, _, _ = index.sheet(path, sheet_idx)
+            child = table.insert(item, tk.END, text=f"{os.path.basename(path)} / {sheet_name}",
+                                 values=("", "", col_count), tags=tags)
+            sheet_of[child] = (path, sheet_idx)
+
+    table.bind("<<TreeviewOpen>>", on_open)
+
+    def show_group_details():
+        selected_item = table.selection()
+        if not selected_item:
+            messagebox.showwarning("Ошибка", "Выберите группу или вкладку для просмотра деталей.")
+            return
+
+        item = selected_item[0]
+        group_item = table.parent(item) or item
+
+        if table.item(group_item, "tags"):
+            members = members_of[group_item]
+            title = table.item(group_item, "text").split(":")[0]
+        elif item in sheet_of:
+            # Для уникальной вкладки показываем её собственный маппинг
+            members = [sheet_of[item]]
+            title = "Уникальная"
+        else:
+            messagebox.showinfo("Информация", "Раскройте список и выберите уникальную вкладку.")
+            return
+
+        headers = index.sheet(*members[0])[2]
+
+        detail_win = tk.Toplevel(win)
+        detail_win.title(f"Детали группы: {title}")
+        detail_win.geometry("700x500")
+
+        tk.Label(detail_win, text=f"Группа: {title}", font=("Arial", 10, "bold")).pack(pady=10)
+        tk.Label(detail_win, text=f"Файлов: {len({path for path, _ in members})} | Вкладок: {len(members)}").pack()
+
+        tk.Label(detail_win, text="Вкладки с одинаковым маппингом:", font=("Arial", 9, "bold")).pack(pady=(10, 5))
+        sheets_text = tk.Text(detail_win, height=5, width=80)
+        sheets_text.pack(padx=10)
+        sheets_text.insert("1.0", "\n".join([f"• {path} / {index.sheet(path, sheet_idx)[0]}"
+                                              for path, sheet_idx in members]))
+        sheets_text.config(state="disabled")
+
+        tk.Label(detail_win, text="Общий маппинг столбцов:", font=("Arial", 9, "bold")).pack(pady=(10, 5))
+
+        cols_table = ttk.Treeview(detail_win, columns=("col_num", "col_name"), show="headings", height=12)
+        cols_table.heading("col_num", text="№")
+        cols_table.heading("col_name", text="Название столбца")
+        cols_table.column("col_num", width=60, anchor="center")
+        cols_table.column("col_name", width=600)
+        cols_table.pack(fill="both", expand=True, padx=10, pady=10)
+
+        for order_num, (col_idx, col_name) in enumerate(headers, 1):
+            cols_table.insert("", tk.END, values=(order_num, col_name))
+
+    def export_batch_mappings():
+        path = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV", "*.csv")],
+            initialfile="all_files_mappings.csv"
+        )
+        if not path:
+            return
+
+        try:
+            with open(path, "w", newline="", encoding="utf-8-sig") as f:
+                w = csv.writer(f)
+                w.writerow(["Файл", "Путь", "Название вкладки", "Количество столбцов", "Группа"])
+                for file_path, sheet_name, col_count, group in index.iter_rows():
+                    w.writerow([os.path.basename(file_path), file_path, sheet_name, col_count, group])
+            messagebox.showinfo("Готово", "Сравнение маппинга всех файлов сохранено в CSV.")
+        except Exception as e:
+            messagebox.showerror("Ошибка", str(e))
+
+    btn_frame = tk.Frame(win)
+    btn_frame.pack(pady=10)
+
+    tk.Button(btn_frame, text="Показать детали группы", width=30,
+              command=show_group_details, bg="#FF9800", fg="white", font=("Arial", 9, "bold")).grid(row=0, column=0, padx=5)
+
+    tk.Button(btn_frame, text="Экспортировать всё в CSV", width=30,
+              command=export_batch_mappings, bg="#2196F3", fg="white", font=("Arial", 9, "bold")).grid(row=0, column=1, padx=5)
+
+    def iter_batch_rows():
+        for file_path, sheet_name, col_count, group in index.iter_rows():
+            yield [os.path.basename(file_path), file_path, sheet_name, col_count, group]
+
+    add_similarity_controls(btn_frame, 1, index)
+    add_xlsx_export_controls(btn_frame, 2, "all_files_mappings.xlsx",
+                             ["Файл", "Путь", "Название вкладки", "Количество столбцов", "Группа"],
+                             iter_batch_rows, [40, 70, 40, 22, 16])
+
+
+# ====================================================================
+#          Похожие маппинги: вкладки с отличием в несколько столбцов
+# ====================================================================
+def add_similarity_controls(frame, row, index):
+    """Поле порога сходства и кнопка «Похожие маппинги» в панели кнопок окна"""
+    threshold = tk.IntVar(value=int(SIMILARITY_THRESHOLD * 100))
+
+    controls = tk.Frame(frame)
+    controls.grid(row=row, column=0, columnspan=2, pady=(8, 0))
+
+    tk.Label(controls, text="Порог сходства, %:").pack(side="left")
+    tk.Spinbox(controls, from_=50, to=100, increment=5, width=5, textvariable=threshold).pack(side="left", padx=5)
+    def on_click():
+        try:
+            percent = threshold.get()
+        except tk.TclError:
+            percent = None
+        if percent is None or not 50 <= percent <= 100:
+            messagebox.showwarning("Ошибка", "Порог сходства — целое число от 50 до 100.")
+            return
+        show_similar_mappings(index, percent / 100)
+
+    tk.Button(controls, text="Похожие маппинги", width=25, command=on_click,
+              bg="#9575CD", fg="white", font=("Arial", 9, "bold")).pack(side="left", padx=5)
+
+
+def show_similar_mappings(index, threshold):
+    # Индекс пополняется в главном потоке, пока идёт анализ, поэтому
+    # в фон и в окно передаётся его копия на момент нажатия
+    snapshot = index.snapshot()
+
+    def work(post, cancel):
+        return snapshot.similar_clusters(threshold)
+
+    run_in_background("Поиск похожих маппингов", work,
+                      lambda clusters: show_similar_mappings_window(snapshot, clusters, threshold))
+
+
+def show_similar_mappings_window(index, clusters, threshold):
+    # Интересны только кластеры, где есть хотя бы два разных маппинга
+    clusters = [cluster for cluster in clusters if len(cluster[1]) >= 2]
+    if not clusters:
+        messagebox.showinfo("Результат", f"Похожих маппингов (сходство от {threshold:.0%}) не найдено.")
+        return
+
+    win = tk.Toplevel(root)
+    win.title(f"Похожие маппинги (сходство от {threshold:.0%})")
+    win.geometry("900x600")
+
+    tk.Label(win, text=f"Кластеров похожих маппингов: {len(clusters)}", font=("Arial", 10, "bold")).pack(pady=10)
+    tk.Label(win, text="Вариант сравнивается с самым частым маппингом кластера: "
+                       "+ лишние столбцы, − недостающие").pack()
+
+    colors = get_group_colors()
+
+    table = ttk.Treeview(win, columns=("similarity", "files", "sheets"), show="tree headings", height=18)
+    table.heading("#0", text="Кластер / Вариант маппинга / Вкладка")
+    table.heading("similarity", text="Сходство")
+    table.heading("files", text="Файлов")
+    table.heading("sheets", text="Вкладок")
+    table.column("#0", width=600)
+    table.column("similarity", width=90, anchor="center")
+    table.column("files", width=80, anchor="center")
+    table.column("sheets", width=80, anchor="center")
+    table.pack(fill="both", expand=True, padx=10, pady=10)
+
+    # Содержимое узла добавляется при раскрытии: строка -> функция заполнения
+    fill_later = {}
+
+    def add_node(parent, text, values, tag, fill):
+        item = table.insert(parent, tk.END, text=text, values=values, tags=tag)
+        table.insert(item, tk.END, text="...")
+        fill_later[item] = fill
+        return item
+
+    def fill_sheets(item, sheets):
+        for path, sheet_idx in sheets:
+            sheet_name, col_count, _, _ = index.sheet(path, sheet_idx)
+            table.insert(item, tk.END, text=f"{os.path.basename(path)} / {sheet_name}",
+                         tags=table.item(item, "tags"))
+
+    def fill_variants(item, representative, members):
+        for signature, similarity, sheets in members:
+            extra, missing = diff_signatures(representative, signature)
+            changes = [f"+{name}" for name in extra] + [f"−{name}" for name in missing]
+            text = ", ".join(changes) if changes else "Представитель кластера"
+            add_node(item, text, (f"{similarity:.0%}", len({path for path, _ in sheets}), len(sheets)),
+                     table.item(item, "tags"), lambda child, sheets=sheets: fill_sheets(child, sheets))
+
+    for num, (representative, members) in enumerate(clusters, 1):
+        tag = f"cluster_{num}"
+        table.tag_configure(tag, background=colors[(num - 1) % len(colors)])
+
+        all_sheets = [sheet for _, _, sheets in members for sheet in sheets]
+        headers = index.sheet(*members[0][2][0])[2]
+        add_node("", f"Кластер {num}: {describe_columns(headers)} — вариантов: {len(members)}",
+                 ("", len({path for path, _ in all_sheets}), len(all_sheets)), tag,
+                 lambda item, representative=representative, members=members:
+                     fill_variants(item, representative, members))
+
+    def on_open(event):
+        item = table.focus()
+        fill = fill_later.pop(item, None)
+        if fill is None:
+            return
+        table.delete(*table.get_children(item))
+        fill(item)
+
+    table.bind("<<TreeviewOpen>>", on_open)
+
+    def export_similar_mappings():
+        path = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV", "*.csv")],
+            initialfile="similar_mappings.csv"
+        )
+        if not path:
+            return
+
+        try:
+            with open(path, "w", newline="", encoding="utf-8-sig") as f:
+                w = csv.writer(f)
+                w.writerow(["Кластер", "Файл", "Путь", "Название вкладки", "Количество столбцов",
+                            "Сходство", "Лишние столбцы", "Недостающие столбцы"])
+                for num, (representative, members) in enumerate(clusters, 1):
+                    for signature, similarity, sheets in members:
+                        extra, missing = diff_signatures(representative, signature)
+                        for file_path, sheet_idx in sheets:
+                            sheet_name, col_count, _, _ = index.sheet(file_path, sheet_idx)
+                            w.writerow([f"Кластер {num}", os.path.basename(file_path), file_path, sheet_name,
+                                        col_count, f"{similarity:.0%}", ", ".join(extra), ", ".join(missing)])
+            messagebox.showinfo("Готово", "Похожие маппинги сохранены в CSV.")
+        except Exception as e:
+            messagebox.showerror("Ошибка", str(e))
+
+    tk.Button(win, text="Экспортировать в CSV", width=30,
+              command=export_similar_mappings, bg="#2196F3", fg="white", font=("Arial", 9, "bold")).pack(pady=10)
+
+
+# ====================================================================
+#            Выгрузка полного анализа всех файлов (NDJSON)
+# ====================================================================
+def export_analysis_ndjson():
+    if not files:
+        messagebox.showwarning("Ошибка", "Добавьте хотя бы один файл.")
+        return
+
+    path = filedialog.asksaveasfilename(
+        defaultextension=".ndjson",
+        filetypes=[("NDJSON", "*.ndjson"), ("JSON Lines", "*.jsonl")],
+        initialfile="analysis.ndjson"
+    )
+    if not path:
+        return
+
+    paths = list(files)
+    force = force_rescan.get()
+    state = {"errors": 0}
+
+    def work(post, cancel):
+        # Запись идёт в фоновом потоке сразу по мере анализа: результаты
+        # не копятся в памяти, а при сбое записанное остаётся в файле.
+        # Уже проанализированные в сессии файлы берутся из моделей книг
+        with NdjsonWriter(path) as writer:
+            scanner = workbooks.scan_structures(paths, force=force)
+            try:
+                for _, info, error in scanner:
+                    if cancel.is_set():
+                        break
+                    result = error or {"structure": info.get_structure(), "oversized": info.oversized}
+                    writer.write(structure_record(info.path, result))
+                    post(error is not None)
+            finally:
+                scanner.close()
+        return writer.count
+
+    def on_item(failed):
+        state["errors"] += failed
+
+    def on_done(count):
+        messagebox.showinfo("Готово", f"Выгружено файлов: {count}, с ошибками: {state['errors']}")
+
+    run_in_background("Выгрузка анализа в NDJSON", work, on_done, total=len(paths), on_item=on_item)
+
 
 # ====================================================================
 #                    Сохранение списка вкладок в CSV
@@ -737,23 +1284,52 @@ def save_to_xlsx(results):
         return
 
     try:
-        from openpyxl import Workbook
-        wb = Workbook()
-        ws = wb.active
-        ws.append(["№", "Файл", "Количество вкладок"])
-        for r in results:
-            ws.append(r)
-        wb.save(path)
+        save_rows_to_xlsx(path, [("Sheet", ["№", "Файл", "Количество вкладок"], results)],
+                          column_widths=[6, 60, 20])
         messagebox.showinfo("Готово", "Excel-файл сохранён.")
     except Exception as e:
         messagebox.showerror("Ошибка", e)
 
 
+def add_xlsx_export_controls(frame, row, initialfile, header, iter_rows, column_widths):
+    """
+    Кнопка выгрузки таблицы маппинга в XLSX и флажок «лист на группу».
+    iter_rows — функция, возвращающая генератор строк (последний столбец — группа)
+    """
+    per_group = tk.BooleanVar(value=False)
+
+    def export_xlsx():
+        path = filedialog.asksaveasfilename(
+            defaultextension=".xlsx",
+            filetypes=[("Excel", "*.xlsx")],
+            initialfile=initialfile
+        )
+        if not path:
+            return
+
+        if per_group.get():
+            sheets = split_rows_by_group(header, iter_rows(), len(header) - 1)
+        else:
+            sheets = [("Маппинг", header, iter_rows())]
+
+        try:
+            save_rows_to_xlsx(path, sheets, column_widths)
+            messagebox.showinfo("Готово", "Сравнение маппинга сохранено в XLSX.")
+        except Exception as e:
+            messagebox.showerror("Ошибка", str(e))
+
+    tk.Button(frame, text="Экспортировать всё в XLSX", width=30,
+              command=export_xlsx, bg="#2196F3", fg="white", font=("Arial", 9, "bold")).grid(row=row, column=0, padx=5, pady=(5, 0))
+    tk.Checkbutton(frame, text="Отдельный лист для каждой группы",
+                   variable=per_group).grid(row=row, column=1, padx=5, pady=(5, 0), sticky="w")
+
+
 # ====================================================================
 #       Drag & Drop с ПОЛНОЙ поддержкой всех языков мира
 # ====================================================================
 def drop(event):
     paths = []
+    folders = []
     
     try:
         raw_paths = root.tk.splitlist(event.data)
@@ -771,6 +1347,11 @@ def drop(event):
                 paths.append(path)
                 continue
             
+            # Папки обходятся рекурсивно в фоне
+            if os.path.isdir(path):
+                folders.append(path)
+                continue
+            
             if sys.platform == "win32":
                 try:
                     path_normalized = unicodedata.normalize('NFC', path)
@@ -807,18 +1388,15 @@ def drop(event):
                 if os.path.isfile(p):
                     paths.append(p)
     
-    added_count = 0
     skipped_count = 0
     
+    excel_paths = []
     for path in paths:
-        ext = os.path.splitext(path)[1].lower()
-        if ext in [".xls", ".xlsx", ".xlsm"]:
-            if path not in files:
-                files.append(path)
-                file_list.insert("", tk.END, values=(len(files), path, ""))
-                added_count += 1
+        if is_excel_file_name(os.path.basename(path)):
+            excel_paths.append(path)
         else:
             skipped_count += 1
+    added_count = add_paths(excel_paths)
     
     if added_count > 0:
         msg = f"✅ Добавлено файлов: {added_count}"
@@ -828,55 +1406,81 @@ def drop(event):
     elif skipped_count > 0:
         messagebox.showwarning("Внимание", f"Пропущено файлов (не Excel): {skipped_count}")
 
+    if folders:
+        add_folders(folders)
+
 
 # ====================================================================
 #                              GUI
 # ====================================================================
-root = TkinterDnD.Tk()
-root.title("Excel Sheet Counter PRO")
-root.geometry("750x600")
-root.resizable(False, False)
+if __name__ == "__main__":
+    # Нужен для процессов-воркеров в собранном exe (Windows)
+    multiprocessing.freeze_support()
 
-if sys.platform == "win32":
+    # Кэш результатов; если папку кэша создать нельзя, работаем без него
     try:
-        sys.stdout.reconfigure(encoding='utf-8')
-    except:
-        pass
+        cache = AnalysisCache()
+    except Exception as e:
+        print(f"Кэш недоступен: {e}")
+        cache = None
+
+    # Модели открытых в сессии книг (общие для всех окон)
+    workbooks = WorkbookRegistry(cache)
+
+    # Маппинг по всем файлам списка (тот же словарь названий, что у моделей книг)
+    mapping_index = BatchMappingIndex(workbooks.vocabulary)
+
+    root = TkinterDnD.Tk()
+    root.title("Excel Sheet Counter PRO")
+    root.geometry("750x680")
+    root.resizable(False, False)
+
+    if sys.platform == "win32":
+        try:
+            sys.stdout.reconfigure(encoding='utf-8')
+        except:
+            pass
+
+    main = tk.Frame(root, padx=10, pady=10)
+    main.pack(fill="both", expand=True)
+
+    tk.Label(main, text="Перетащите Excel-файлы или папки сюда или нажмите 'Добавить файлы'").pack()
+
+    file_list = VirtualFileList(main, files, rows=10)
+    file_list.pack(fill="both", expand=True, pady=10)
 
-main = tk.Frame(root, padx=10, pady=10)
-main.pack(fill="both", expand=True)
+    file_list.tree.drop_target_register(DND_FILES)
+    file_list.tree.dnd_bind("<<Drop>>", drop)
 
-tk.Label(main, text="Перетащите Excel-файлы сюда или нажмите 'Добавить файлы'").pack()
+    btns = tk.Frame(main)
+    btns.pack()
 
-file_list = ttk.Treeview(main, columns=("num", "path", "count"), show="headings", height=10)
-file_list.heading("num", text="№")
-file_list.heading("path", text="Путь к файлу")
-file_list.heading("count", text="Вкладок")
-file_list.column("num", width=40, anchor="center")
-file_list.column("path", width=580)
-file_list.column("count", width=80, anchor="center")
-file_list.pack(fill="both", expand=True, pady=10)
+    tk.Button(btns, text="Добавить файлы", width=18, command=add_files).grid(row=0, column=0, padx=5)
+    tk.Button(btns, text="Добавить папку", width=18, command=add_folder).grid(row=0, column=1, padx=5)
+    tk.Button(btns, text="Очистить список", width=18, command=clear_list).grid(row=0, column=2, padx=5)
+    tk.Button(btns, text="Подсчитать вкладки", width=18, command=count_all).grid(row=0, column=3, padx=5)
 
-file_list.drop_target_register(DND_FILES)
-file_list.dnd_bind("<<Drop>>", drop)
+    btns2 = tk.Frame(main)
+    btns2.pack(pady=5)
 
-btns = tk.Frame(main)
-btns.pack()
+    tk.Button(btns2, text="Показать вкладки выбранного файла", width=40, 
+              command=show_sheets, bg="#92D794", fg="white", font=("Arial", 9, "bold")).grid(row=0, column=0, padx=5, pady=2)
 
-tk.Button(btns, text="Добавить файлы", width=18, command=add_files).grid(row=0, column=0, padx=5)
-tk.Button(btns, text="Очистить список", width=18, command=clear_list).grid(row=0, column=1, padx=5)
-tk.Button(btns, text="Подсчитать вкладки", width=18, command=count_all).grid(row=0, column=2, padx=5)
+    tk.Button(btns2, text="Показать все столбцы файла", width=40, 
+              command=show_columns, bg="#80CBC4", fg="white", font=("Arial", 9, "bold")).grid(row=1, column=0, padx=5, pady=2)
 
-btns2 = tk.Frame(main)
-btns2.pack(pady=5)
+    tk.Button(btns2, text="Сравнить маппинг столбцов вкладок", width=40, 
+              command=compare_sheet_mappings, bg="#C290CA", fg="white", font=("Arial", 9, "bold")).grid(row=2, column=0, padx=5, pady=2)
 
-tk.Button(btns2, text="Показать вкладки выбранного файла", width=40, 
-          command=show_sheets, bg="#92D794", fg="white", font=("Arial", 9, "bold")).grid(row=0, column=0, padx=5, pady=2)
+    tk.Button(btns2, text="Сравнить маппинг по всем файлам", width=40,
+              command=compare_all_mappings, bg="#9575CD", fg="white", font=("Arial", 9, "bold")).grid(row=3, column=0, padx=5, pady=2)
 
-tk.Button(btns2, text="Показать все столбцы файла", width=40, 
-          command=show_columns, bg="#80CBC4", fg="white", font=("Arial", 9, "bold")).grid(row=1, column=0, padx=5, pady=2)
+    tk.Button(btns2, text="Выгрузить анализ всех файлов (NDJSON)", width=40,
+              command=export_analysis_ndjson, bg="#78909C", fg="white", font=("Arial", 9, "bold")).grid(row=4, column=0, padx=5, pady=2)
 
-tk.Button(btns2, text="Сравнить маппинг столбцов вкладок", width=40, 
-          command=compare_sheet_mappings, bg="#C290CA", fg="white", font=("Arial", 9, "bold")).grid(row=2, column=0, padx=5, pady=2)
+    # Игнорировать кэш и перечитать файлы заново
+    force_rescan = tk.BooleanVar(value=False)
+    tk.Checkbutton(main, text="Пересканировать файлы (не использовать кэш)",
+                   variable=force_rescan).pack()
 
-root.mainloop()
+    root.mainloop()
@@ -0,0 +1,291 @@
+"""
+Консольный (без GUI) режим Excel Sheet Counter для пакетной обработки.
+
+Примеры:
+    python tabcounter_cli.py count D:\\exports -o counts.csv
+    python tabcounter_cli.py sheets "reports/**/*.xlsx" -f ndjson
+    python tabcounter_cli.py columns a.xlsx b.xls -f json -j 8
+    python tabcounter_cli.py mappings D:\\exports --cache
+    python tabcounter_cli.py structure D:\\exports -o analysis.ndjson --resume
+
+Коды выхода: 0 — всё обработано, 1 — часть файлов с ошибками,
+2 — неверные аргументы или не найдено ни одного Excel-файла.
+tkinter не импортируется, дисплей не нужен.
+"""
+import os
+import sys
+import csv
+import json
+import glob
+import argparse
+import multiprocessing
+
+from tabcore import (
+    get_column_letter,
+    group_sheets_by_mapping,
+    iter_excel_files,
+    is_excel_file_name,
+    structure_record,
+    read_exported_files,
+    NdjsonWriter,
+)
+from tabcache import AnalysisCache, read_sheet_lists_cached, read_structures_cached
+
+EXIT_OK = 0
+EXIT_FILE_ERRORS = 1
+EXIT_USAGE = 2
+
+# Поля записей для каждой команды (порядок колонок в CSV)
+FIELDS = {
+    "count": ["file", "sheets", "error"],
+    "sheets": ["file", "index", "sheet", "error"],
+    "columns": ["file", "sheet", "header_row", "columns", "headers", "error"],
+    "mappings": ["file", "sheet", "columns", "group", "error"],
+    # Одна запись NDJSON на файл (формат -f не используется)
+    "structure": ["file", "sheets", "oversized", "error"],
+}
+
+
+# ====================================================================
+#                        Сбор входных файлов
+# ====================================================================
+def collect_files(targets):
+    """
+    Разворачивает файлы, папки (рекурсивно) и маски вида *.xlsx или **/*.xls
+    Возвращает: список путей к Excel-файлам без повторов, в порядке обнаружения
+    """
+    found = {}
+
+    for target in targets:
+        if os.path.isdir(target):
+            for path in iter_excel_files(target):
+                found.setdefault(path, None)
+        elif glob.has_magic(target):
+            for path in sorted(glob.glob(target, recursive=True)):
+                if os.path.isfile(path):
+                    found.setdefault(path, None)
+        else:
+            found.setdefault(target, None)
+
+    return [path for path in found if is_excel_file_name(os.path.basename(path))]
+
+
+# ====================================================================
+#                     Обработка файлов по командам
+# ====================================================================
+def iter_sheet_lists(paths, cache, force, workers):
+    """Генератор: (путь, список_вкладок или строка с ошибкой) в порядке готовности"""
+    for _, path, sheets in read_sheet_lists_cached(paths, cache, force, workers):
+        yield path, sheets
+
+
+def iter_structures(paths, cache, force, workers):
+    """Генератор: (путь, структура или строка с ошибкой) в порядке готовности"""
+    for _, path, result in read_structures_cached(paths, cache, force, workers):
+        yield path, result if isinstance(result, str) else result["structure"]
+
+
+def records_for(command, path, result):
+    """Превращает результат по одному файлу в записи вывода"""
+    if isinstance(result, str):
+        return [{"file": path, "error": result}]
+
+    if command == "count":
+        return [{"file": path, "sheets": len(result)}]
+
+    if command == "sheets":
+        return [{"file": path, "index": idx, "sheet": name} for idx, name in result]
+
+    if command == "columns":
+        return [{
+            "file": path,
+            "sheet": sheet_name,
+            "header_row": header_row,
+            "columns": col_count,
+            "headers": [f"{get_column_letter(col_idx)}: {name}" for col_idx, name in headers],
+        } for sheet_name, col_count, headers, header_row in result]
+
+    # mappings: группы внутри файла, как в окне «Сравнить маппинг»
+    group_of = {}
+    group_num = 1
+    for sheet_indices in group_sheets_by_mapping(result).values():
+        if len(sheet_indices) >= 2:
+            for sheet_idx in sheet_indices:
+                group_of[sheet_idx] = f"Группа {group_num}"
+            group_num += 1
+
+    return [{
+        "file": path,
+        "sheet": sheet_name,
+        "columns": col_count,
+        "group": group_of.get(sheet_idx, "Уникальная"),
+    } for sheet_idx, (sheet_name, col_count, headers, header_row) in enumerate(result) if headers]
+
+
+# ====================================================================
+#                              Вывод
+# ====================================================================
+class RecordWriter:
+    """Пишет записи в CSV, JSON (массив) или NDJSON по мере поступления"""
+
+    def __init__(self, stream, fmt, fields):
+        self.stream = stream
+        self.fmt = fmt
+        self.fields = fields
+        self.count = 0
+
+        if fmt == "csv":
+            self.csv = csv.DictWriter(stream, fieldnames=fields, extrasaction="ignore")
+            self.csv.writeheader()
+        elif fmt == "json":
+            stream.write("[")
+
+    def write(self, record):
+        if self.fmt == "csv":
+            row = dict(record)
+            if isinstance(row.get("headers"), list):
+                row["headers"] = " | ".join(row["headers"])
+            self.csv.writerow(row)
+        else:
+            text = json.dumps(record, ensure_ascii=False)
+            if self.fmt == "json":
+                text = ("\n  " if self.count == 0 else ",\n  ") + text
+            else:
+                text += "\n"
+            self.stream.write(text)
+        self.count += 1
+
+    def close(self):
+        if self.fmt == "json":
+            self.stream.write("\n]\n" if self.count else "]\n")
+        self.stream.flush()
+
+
+def export_structures(paths, output, append, cache, force, workers):
+    """
+    Команда structure: запись по файлу пишется сразу после его анализа,
+    поэтому при сбое уже выгруженные файлы сохраняются
+    Возвращает: число файлов с ошибками
+    """
+    writer = NdjsonWriter(output, append=append) if output else None
+    errors = 0
+
+    try:
+        for _, path, result in read_structures_cached(paths, cache, force, workers):
+            if isinstance(result, str):
+                errors += 1
+                print(f"{path}: {result}", file=sys.stderr)
+
+            record = structure_record(path, result)
+            if writer:
+                writer.write(record)
+            else:
+                sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+                sys.stdout.flush()
+    finally:
+        if writer:
+            writer.close()
+
+    return errors
+
+
+# ====================================================================
+#                          Точка входа
+# ====================================================================
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Подсчёт вкладок и анализ столбцов Excel-файлов без GUI")
+    parser.add_argument("command", choices=list(FIELDS),
+                        help="count — число вкладок, sheets — список вкладок, "
+                             "columns — заголовки столбцов, mappings — группы маппинга, "
+                             "structure — полный анализ, одна строка NDJSON на файл")
+    parser.add_argument("targets", nargs="+",
+                        help="файлы, папки (обходятся рекурсивно) или маски")
+    parser.add_argument("-f", "--format", choices=["csv", "json", "ndjson"], default="csv",
+                        help="формат вывода (по умолчанию csv)")
+    parser.add_argument("-o", "--output", help="файл вывода (по умолчанию stdout)")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="число процессов (по умолчанию по числу ядер)")
+    parser.add_argument("--cache", action="store_true",
+                        help="использовать постоянный кэш результатов")
+    parser.add_argument("--cache-path", help="путь к файлу кэша (включает --cache)")
+    parser.add_argument("--rescan", action="store_true",
+                        help="не брать результаты из кэша, а перечитать файлы")
+    parser.add_argument("--resume", action="store_true",
+                        help="structure: дописать в -o, пропустив уже выгруженные файлы "
+                             "(файлы с ошибкой анализируются снова)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    paths = collect_files(args.targets)
+    if not paths:
+        print("Ошибка: не найдено ни одного Excel-файла", file=sys.stderr)
+        return EXIT_USAGE
+
+    if args.resume:
+        if args.command != "structure" or not args.output:
+            print("Ошибка: --resume работает только с командой structure и -o", file=sys.stderr)
+            return EXIT_USAGE
+        done = read_exported_files(args.output)
+        total = len(paths)
+        paths = [path for path in paths if path not in done]
+        print(f"Уже выгружено: {total - len(paths)}, осталось: {len(paths)}", file=sys.stderr)
+
+    cache = None
+    if args.cache or args.cache_path:
+        try:
+            cache = AnalysisCache(args.cache_path)
+        except Exception as e:
+            print(f"Кэш недоступен: {e}", file=sys.stderr)
+
+    if args.command == "structure":
+        try:
+            errors = export_structures(paths, args.output, args.resume, cache, args.rescan, args.workers)
+        finally:
+            if cache is not None:
+                cache.close()
+        print(f"Обработано файлов: {len(paths)}, с ошибками: {errors}", file=sys.stderr)
+        return EXIT_FILE_ERRORS if errors else EXIT_OK
+
+    if args.command in ["count", "sheets"]:
+        results = iter_sheet_lists(paths, cache, args.rescan, args.workers)
+    else:
+        results = iter_structures(paths, cache, args.rescan, args.workers)
+
+    stream = open(args.output, "w", newline="", encoding="utf-8-sig" if args.format == "csv" else "utf-8") \
+        if args.output else sys.stdout
+    writer = RecordWriter(stream, args.format, FIELDS[args.command])
+    errors = 0
+
+    try:
+        for path, result in results:
+            if isinstance(result, str):
+                errors += 1
+                print(f"{path}: {result}", file=sys.stderr)
+            for record in records_for(args.command, path, result):
+                writer.write(record)
+    finally:
+        writer.close()
+        if args.output:
+            stream.close()
+        if cache is not None:
+            cache.close()
+
+    print(f"Обработано файлов: {len(paths)}, с ошибками: {errors}", file=sys.stderr)
+    return EXIT_FILE_ERRORS if errors else EXIT_OK
+
+
+if __name__ == "__main__":
+    # Нужен для процессов-воркеров в собранном exe (Windows)
+    multiprocessing.freeze_support()
+
+    if sys.platform == "win32":
+        try:
+            sys.stdout.reconfigure(encoding='utf-8')
+        except:
+            pass
+
+    sys.exit(main())